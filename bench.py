@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+"""
+bench.py — Benchmarks build.py on synthetic content.yaml files of growing size
+
+Usage:
+    python bench.py                  Run the default sizes and compare with bench_baseline.json
+    python bench.py --sizes 100,2000 Publications (and honors) per synthetic profile
+    python bench.py --save-baseline  Store this run as the new baseline
+
+Each synthetic profile is content.yaml with its publications and honors
+repeated up to N entries (research experience and leadership up to N/10).
+For each size the YAML load (cold and from the parsed-content cache), every
+section builder, the page assembly and the final write are timed separately
+(best of --repeat runs), and the peak memory of one full load + streamed
+build + write is recorded with tracemalloc. Timings more than --tolerance slower
+than the baseline are flagged and make the script exit with status 1.
+"""
+import sys, os, io, copy, json, time, argparse, contextlib, platform, tempfile, tracemalloc
+
+import yaml
+
+import build
+
+BASELINE_PATH = "bench_baseline.json"
+DEFAULT_SIZES = (100, 1000, 5000)
+MIN_DELTA = 0.002  # seconds; smaller slowdowns are treated as timer noise
+
+# Lists scaled to N entries, and to N/10 entries
+SCALED = ("publications", "honors")
+SCALED_TENTH = ("research_experience", "leadership")
+
+
+# ── Synthetic content ─────────────────────────────────────────────────────
+
+def _vary(item, i):
+    """Copy of `item` with its title-like text suffixed by the copy number,
+    so the generated entries are not all identical."""
+    item = copy.deepcopy(item)
+    for key in ("title", "name", "role"):
+        val = item.get(key)
+        if isinstance(val, str):
+            item[key] = f"{val} #{i}"
+        elif isinstance(val, dict):
+            item[key] = {code: f"{text} #{i}" for code, text in val.items()}
+    return item
+
+
+def synth_content(base, n):
+    """`base` content with its scaled lists grown (cyclically) to n entries."""
+    c = copy.deepcopy(base)
+    for key, count in [(k, n) for k in SCALED] + [(k, max(1, n // 10)) for k in SCALED_TENTH]:
+        items = base.get(key) or []
+        if items:
+            c[key] = [_vary(items[i % len(items)], i) for i in range(count)]
+    return c
+
+
+def write_synth(base, n, directory):
+    path = os.path.join(directory, f"content-{n}.yaml")
+    with open(path, "w", encoding="utf-8") as f:
+        yaml.safe_dump(synth_content(base, n), f, allow_unicode=True, sort_keys=False)
+    return path
+
+
+# ── Measurement ───────────────────────────────────────────────────────────
+
+def _best(fn, repeat):
+    best, result = float("inf"), None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def bench_size(path, repeat):
+    """Stage timings (seconds) and peak memory (MB) for one content file."""
+    out_path = os.path.join(os.path.dirname(path), "index.html")
+    timings = {}
+    timings["yaml_load"], c = _best(lambda: build.load_content(path, cache=False), repeat)
+    with contextlib.redirect_stdout(io.StringIO()):
+        build.load_content(path)  # prime the parsed-content cache
+        timings["yaml_load_cached"], _ = _best(lambda: build.load_content(path), repeat)
+    for name, (builder, select) in build.SECTIONS.items():
+        args = select(c, None)
+        timings[f"section:{name}"], _ = _best(lambda: "".join(builder(*args)), repeat)
+    timings["build_html"], html = _best(lambda: build.build_html(c), repeat)
+    timings["write"], _ = _best(lambda: (os.path.exists(out_path) and os.remove(out_path),
+                                         build.write_if_changed(out_path, html)), repeat)
+
+    tracemalloc.start()
+    build.write_stream(out_path, build.render_page(build.load_content(path, cache=False)))
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    timings = {stage: round(sec, 6) for stage, sec in timings.items()}
+    return {"timings": timings, "peak_mb": round(peak / 2**20, 2), "html_bytes": len(html.encode())}
+
+
+@contextlib.contextmanager
+def _cache_dir(path):
+    """Point build.py's caches at `path`, so the synthetic content files do
+    not leave parsed copies in the repository's .build-cache."""
+    saved, build.CACHE_DIR = build.CACHE_DIR, path
+    try:
+        yield
+    finally:
+        build.CACHE_DIR = saved
+
+
+def run(sizes, repeat):
+    base = build.load_content()
+    results = {}
+    with tempfile.TemporaryDirectory(prefix="bench-") as tmp, _cache_dir(os.path.join(tmp, ".build-cache")):
+        for n in sizes:
+            path = write_synth(base, n, tmp)
+            results[str(n)] = bench_size(path, repeat)
+            results[str(n)]["yaml_bytes"] = os.path.getsize(path)
+            print(f"  size {n}: {results[str(n)]['html_bytes']:,} bytes of HTML", file=sys.stderr)
+    return results
+
+
+# ── Report ────────────────────────────────────────────────────────────────
+
+def compare(results, baseline, tolerance):
+    """Print one table per size; return the list of regressions found."""
+    regressions = []
+    for size, res in results.items():
+        base = (baseline or {}).get(size)
+        print(f"\nsize {size}  ({res['yaml_bytes']:,} bytes YAML → {res['html_bytes']:,} bytes HTML)")
+        print(f"  {'stage':<30}{'ms':>10}{'baseline':>10}{'change':>9}")
+        rows = [(stage, sec * 1000, base and base["timings"].get(stage)) for stage, sec in res["timings"].items()]
+        rows.append(("peak memory (MB)", res["peak_mb"], base and base["peak_mb"]))
+        for stage, value, old in rows:
+            line = f"  {stage:<30}{value:>10.2f}"
+            if old is not None:
+                old_value = old * 1000 if stage in res["timings"] else old
+                change = (value - old_value) / old_value if old_value else 0.0
+                slower = change > tolerance and (stage not in res["timings"] or value - old_value > MIN_DELTA * 1000)
+                line += f"{old_value:>10.2f}{change:>+8.0%}" + ("  REGRESSION" if slower else "")
+                if slower:
+                    regressions.append((size, stage, old_value, value))
+            print(line)
+    return regressions
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark build.py on synthetic content of growing size.")
+    parser.add_argument("--sizes", default=",".join(map(str, DEFAULT_SIZES)),
+                        help="comma-separated publication counts (default %(default)s)")
+    parser.add_argument("--repeat", type=int, default=5, help="runs per stage; the best is kept (default 5)")
+    parser.add_argument("--tolerance", type=float, default=0.5,
+                        help="fractional slowdown vs. the baseline that counts as a regression (default 0.5)")
+    parser.add_argument("--baseline", default=BASELINE_PATH, help="baseline JSON file (default %(default)s)")
+    parser.add_argument("--save-baseline", action="store_true", help="write this run to the baseline file")
+    return parser.parse_args(argv)
+
+
+def main():
+    args = parse_args()
+    sizes = [int(s) for s in args.sizes.split(",") if s.strip()]
+    results = run(sizes, args.repeat)
+
+    try:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)["results"]
+    except FileNotFoundError:
+        baseline = None
+    regressions = compare(results, baseline, args.tolerance)
+
+    if args.save_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump({"python": platform.python_version(), "machine": platform.machine(),
+                       "results": results}, f, indent=2)
+            f.write("\n")
+        print(f"\nSaved baseline to {args.baseline}")
+    elif regressions:
+        print(f"\n{len(regressions)} regression(s) beyond {args.tolerance:.0%} of the baseline")
+        sys.exit(1)
+    elif baseline is None:
+        print(f"\nNo baseline at {args.baseline}; run with --save-baseline to create one")
+
+
+if __name__ == "__main__":
+    main()
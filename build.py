@@ -5,14 +5,63 @@ build.py — Generates index.html from content.yaml
 Usage:
     python build.py          Build index.html from content.yaml
     python build.py --init   Generate a blank content.yaml template
+    python build.py --incremental
+                             Reuse cached section fragments that did not change
+    python build.py --watch  Rebuild on save and serve with live reload on :8000
+    python build.py --split-lang
+                             Write index.html (en) and zh/index.html, one language each
+    python build.py --optimize
+                             Minify HTML/CSS and prune unused CSS selectors
+    python build.py --compress
+                             Also write .gz/.br copies of every text output
+    python build.py --service-worker
+                             Generate sw.js to precache the site for instant repeat visits
+    python build.py --defer-sections
+                             Defer layout of the sections below the fold until scrolled near
+    python build.py --icon-sprite external
+                             Link the SVG icon sprite as a cacheable file instead of inlining it
+    python build.py --dist [DIR]
+                             Also publish just the files the pages reference to dist/
+    python build.py --strict-budgets
+                             Fail the build when a page exceeds its performance budgets
+    python build.py --batch 'sites/*/content.yaml' [--jobs N]
+                             Build many sites in parallel, each in its own directory
+    python build.py --profile [--cprofile FILE]
+                             Report stage timings and per-section page weight
+
+Images referenced by content.yaml (the profile photo and publication
+thumbnails) are resized into AVIF/WebP/JPEG variants under assets/gen/
+when Pillow is installed (pip install pillow). Without it the original
+files are linked as-is.
+
+main.js is published as a minified bundle of only the features the site
+uses (see the "// @feature" markers in main.js).
+
+Every other local file the page references (style.css, main.js, PDFs, ...)
+is copied to assets/gen/ as name.<hash>.ext and the HTML is rewritten to
+point at the copy; assets/gen/manifest.json maps source paths to copies.
+
+Font files in fonts/ are subset to the characters the page uses and
+self-hosted as WOFF2 when fontTools is installed (pip install fonttools
+brotli); otherwise the page loads Google Fonts.
+
+With --incremental, rendered section fragments are cached in .build-cache/
+and only sections whose content (or builder code) changed are re-rendered.
+index.html is only rewritten when its bytes change. The parsed content.yaml
+is cached there too and reused while the file is unchanged.
+
+The page layout and section markup are templates/*.html, compiled once
+into Python render functions (cached in .build-cache/templates/ by template
+hash). Template output is HTML-escaped unless marked |safe.
+
+Pages are rendered, processed and written as streams of fragments spooled
+through temporary files, so memory use stays flat as the content grows.
 """
-import sys, html as html_mod, hashlib, time
+import sys, os, re, io, glob, json, time, shutil, pickle, argparse, tempfile, threading, queue
+import html as html_mod, hashlib, marshal, functools, itertools, contextlib
 
-try:
-    import yaml
-except ImportError:
-    print("PyYAML is required. Install it with:  pip install pyyaml")
-    sys.exit(1)
+# Heavier modules (PyYAML, concurrent.futures, http.server, ctypes, ...) are
+# imported by the stage that needs them, so unchanged builds start quickly.
 
 # ── SVG icon definitions (keyed by icon name in content.yaml) ─────────────
 ICONS = {
@@ -21,387 +70,1651 @@ ICONS = {
     "cv": '<svg xmlns="http://www.w3.org/2000/svg" width="20" height="20" viewBox="0 0 24 24" fill="none" stroke="currentColor" stroke-width="2" stroke-linecap="round" stroke-linejoin="round"><path d="M14 2H6a2 2 0 0 0-2 2v16a2 2 0 0 0 2 2h12a2 2 0 0 0 2-2V8z"/><polyline points="14 2 14 8 20 8"/><line x1="16" y1="13" x2="8" y2="13"/><line x1="16" y1="17" x2="8" y2="17"/><polyline points="10 9 9 9 8 9"/></svg>',
     "transcript": '<svg xmlns="http://www.w3.org/2000/svg" width="20" height="20" viewBox="0 0 24 24" fill="none" stroke="currentColor" stroke-width="2" stroke-linecap="round" stroke-linejoin="round"><path d="M4 19.5v-15A2.5 2.5 0 0 1 6.5 2H20v20H6.5a2.5 2.5 0 0 1 0-5H20"/><path d="M8 7h6"/><path d="M8 11h8"/></svg>',
     "wechat": '<svg xmlns="http://www.w3.org/2000/svg" width="20" height="20" viewBox="0 0 24 24" fill="currentColor"><path d="M8.691 2.188C3.891 2.188 0 5.476 0 9.53c0 2.212 1.17 4.203 3.002 5.55a.59.59 0 0 1 .213.665l-.39 1.48c-.019.07-.048.141-.048.213 0 .163.13.295.29.295a.326.326 0 0 0 .167-.054l1.903-1.114a.864.864 0 0 1 .717-.098 10.16 10.16 0 0 0 2.837.403c.276 0 .543-.027.811-.05-.857-2.578.157-4.972 1.932-6.446 1.703-1.415 3.882-1.98 5.853-1.838-.576-3.583-4.196-6.348-8.596-6.348zM5.785 5.991c.642 0 1.162.529 1.162 1.18a1.17 1.17 0 0 1-1.162 1.178A1.17 1.17 0 0 1 4.623 7.17c0-.651.52-1.18 1.162-1.18zm5.813 0c.642 0 1.162.529 1.162 1.18a1.17 1.17 0 0 1-1.162 1.178 1.17 1.17 0 0 1-1.162-1.178c0-.651.52-1.18 1.162-1.18zm3.636 4.343c-2.554 0-4.884.955-6.308 2.544-1.313 1.467-1.737 3.4-.93 5.108.753 1.596 2.547 2.79 4.527 3.258a9.48 9.48 0 0 0 2.71.391c.768 0 1.544-.104 2.298-.313a.703.703 0 0 1 .583.08l1.544.904a.265.265 0 0 0 .136.044c.13 0 .236-.108.236-.24 0-.059-.023-.116-.039-.174l-.317-1.2a.481.481 0 0 1 .173-.54C21.847 19.36 24 17.59 24 15.41c0-2.93-3.139-5.078-8.766-5.078zm-2.833 2.27c.522 0 .944.43.944.96a.952.952 0 0 1-.944.958.952.952 0 0 1-.944-.957c0-.53.422-.96.944-.96zm4.727 0c.522 0 .944.43.944.96a.952.952 0 0 1-.944.958.952.952 0 0 1-.944-.957c0-.53.422-.96.944-.96z"/></svg>',
+    # Theme toggle
+    "sun": '<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 24 24" fill="none" stroke="currentColor" stroke-width="2" stroke-linecap="round" stroke-linejoin="round"><circle cx="12" cy="12" r="5"/><line x1="12" y1="1" x2="12" y2="3"/><line x1="12" y1="21" x2="12" y2="23"/><line x1="4.22" y1="4.22" x2="5.64" y2="5.64"/><line x1="18.36" y1="18.36" x2="19.78" y2="19.78"/><line x1="1" y1="12" x2="3" y2="12"/><line x1="21" y1="12" x2="23" y2="12"/><line x1="4.22" y1="19.78" x2="5.64" y2="18.36"/><line x1="18.36" y1="5.64" x2="19.78" y2="4.22"/></svg>',
+    "moon": '<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 24 24" fill="none" stroke="currentColor" stroke-width="2" stroke-linecap="round" stroke-linejoin="round"><path d="M21 12.79A9 9 0 1 1 11.21 3 7 7 0 0 0 21 12.79z"/></svg>',
+    # Publication thumbnail placeholder
+    "paper": '<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 160 100"><rect width="160" height="100" fill="#e9ecef" rx="4"/><text x="80" y="50" text-anchor="middle" dominant-baseline="middle" fill="#adb5bd" font-size="12" font-family="Inter, sans-serif">Paper</text></svg>',
 }
 
 
+# ── Static labels (template text outside content.yaml) ───────────────────
+LABELS = {
+    "nav_about": {"en": "About", "zh": "关于"},
+    "nav_research": {"en": "Research", "zh": "研究"},
+    "nav_publications": {"en": "Publications", "zh": "论文发表"},
+    "nav_resexp": {"en": "Experience", "zh": "研究经历"},
+    "nav_honors": {"en": "Honors", "zh": "荣誉"},
+    "nav_experience": {"en": "Leadership", "zh": "学生工作"},
+    "research": {"en": "Research", "zh": "研究方向"},
+    "publications": {"en": "Publications", "zh": "论文发表"},
+    "resexp": {"en": "Research Experience", "zh": "研究经历"},
+    "honors": {"en": "Honors & Awards", "zh": "荣誉与奖项"},
+    "experience": {"en": "Leadership & Service", "zh": "学生工作与社会实践"},
+    "social_practice": {"en": "Social Practice", "zh": "社会实践"},
+    "visitors": {"en": "Total visitors: ", "zh": "总访问人数："},
+    "pw_title": {"en": "This file is password-protected", "zh": "此文件需要密码访问"},
+    "pw_error": {"en": "Incorrect password", "zh": "密码错误"},
+    "pw_cancel": {"en": "Cancel", "zh": "取消"},
+    "pw_submit": {"en": "Submit", "zh": "确认"},
+    "pub_search": {"en": "Filter by title, author or venue", "zh": "按标题、作者或发表处筛选"},
+}
+
+LANGS = ("en", "zh")
+
+
 # ── Helpers ────────────────────────────────────────────────────────────────
 
-def bi(val):
-    """Wrap a bilingual value {en, zh} into paired spans. Pass-through for strings."""
-    if isinstance(val, dict):
-        return f'<span class="lang-en">{val["en"]}</span><span class="lang-zh">{val["zh"]}</span>'
-    return str(val)
+class Markup(str):
+    """Text that is already HTML: escape() and templates emit it as is.
+    It hashes apart from the equal str, so _ESCAPED never mistakes one for
+    the other."""
+    __slots__ = ()
+
+    def __hash__(self):
+        return hash((Markup, str(self)))
+
+
+class _Escaped(dict):
+    """escape() as a mapping: `_ESCAPED[value]` is `value` HTML-escaped.
+    Every str looked up is stored with its escaped form, so looking it up
+    again is a plain dict hit; Markup (which never matches a stored str,
+    see Markup) and other values are passed to __missing__ each time."""
+    __slots__ = ()
+
+    def __missing__(self, value):
+        if value.__class__ is not str:
+            return value if isinstance(value, Markup) else html_mod.escape(str(value))
+        out = html_mod.escape(value)
+        if len(self) < 1 << 16:
+            self[value] = out
+        return out
+
+
+_ESCAPED = _Escaped()
+
+
+class _Bilingual(dict):
+    """The markup for both languages of a bilingual value: keyed by its
+    (en, zh) texts, the escaped spans of bi(); keyed by (tag, cls, en, zh),
+    the blocks of bi_block(). Rendering the same value again is one dict
+    hit. Cached, like _ESCAPED, only for plain str."""
+    __slots__ = ()
+
+    def __missing__(self, key):
+        if len(key) == 2:
+            en, zh = key
+            out = f'<span class="lang-en">{_ESCAPED[en]}</span><span class="lang-zh">{_ESCAPED[zh]}</span>'
+        else:
+            tag, cls, en, zh = key
+            out = (
+                f'<{tag} class="{cls} lang-en">{en}</{tag}>\n'
+                f'                    <{tag} class="{cls} lang-zh">{zh}</{tag}>'
+            )
+        if all(part.__class__ is str for part in key) and len(self) < 1 << 16:
+            self[key] = out
+        return out
+
+
+_BILINGUAL = _Bilingual()
+
+
+def escape(value):
+    """HTML-escape `value` for element text or a quoted attribute, unless
+    it is Markup."""
+    return _ESCAPED[value]
+
+
+def bi(val, lang=None, html=False):
+    """Wrap a bilingual value {en, zh} into paired spans. Pass-through for strings.
+    With `lang` set (per-language pages), only that language is emitted.
+    The text is escaped unless `html` is set (content fields that allow HTML)."""
+    return Markup(_bi(val, lang, html))
+
+
+def _bi(val, lang=None, html=False):
+    """bi() as a plain str, for templates (which know its output is HTML)."""
+    if val.__class__ is dict:
+        if lang:
+            return val[lang] if html else _ESCAPED[val[lang]]
+        if html:
+            return f'<span class="lang-en">{val["en"]}</span><span class="lang-zh">{val["zh"]}</span>'
+        return _BILINGUAL[val["en"], val["zh"]]
+    return val if html else _ESCAPED[val]
+
+
+def bi_block(tag, cls, val, lang=None):
+    """Two block-level elements for en/zh (one when `lang` is set)."""
+    return Markup(_bi_block(tag, cls, val, lang))
+
+
+def _bi_block(tag, cls, val, lang=None):
+    """bi_block() as a plain str, for templates."""
+    if lang:
+        return f'<{tag} class="{cls}">{val[lang]}</{tag}>'
+    return _BILINGUAL[tag, cls, val["en"], val["zh"]]
+
+
+def write_if_changed(path, data):
+    """Atomically write `data` (str or bytes) to `path` unless the file already
+    holds exactly those bytes. Returns True if the file was written."""
+    if isinstance(data, str):
+        data = data.encode("utf-8")
+    try:
+        with open(path, "rb") as f:
+            if f.read() == data:
+                return False
+    except FileNotFoundError:
+        pass
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path) or ".", prefix=".tmp-")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.chmod(tmp, 0o644)
+        os.replace(tmp, path)
+    except BaseException:
+        os.remove(tmp)
+        raise
+    return True
+
+
+def write_stream(path, fragments, digest=None):
+    """write_if_changed() for a stream of str fragments: they are written
+    through a buffered temporary file next to `path` and only renamed into
+    place when the bytes differ from the existing file, so memory use does
+    not grow with the page. `digest` (a hashlib object), if given, is fed
+    the bytes as well. Returns True if the file was written."""
+    import filecmp
+
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path) or ".", prefix=".tmp-")
+    try:
+        with os.fdopen(fd, "wb", buffering=1 << 16) as f:
+            for fragment in fragments:
+                data = fragment.encode("utf-8")
+                f.write(data)
+                if digest is not None:
+                    digest.update(data)
+        if os.path.isfile(path) and filecmp.cmp(tmp, path, shallow=False):
+            os.remove(tmp)
+            return False
+        os.chmod(tmp, 0o644)
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+    return True
+
+
+def spool(fragments, size=1 << 16):
+    """Drain `fragments` into an anonymous temporary file and return a
+    function that streams them back (from the start on every call).
+    Consecutive fragments are joined into pieces of about `size`
+    characters; size 0 keeps every fragment separate."""
+    f = tempfile.TemporaryFile()
+    buf, n = [], 0
+    for fragment in fragments:
+        buf.append(fragment)
+        n += len(fragment)
+        if n >= size:
+            pickle.dump("".join(buf), f, pickle.HIGHEST_PROTOCOL)
+            buf, n = [], 0
+    if buf:
+        pickle.dump("".join(buf), f, pickle.HIGHEST_PROTOCOL)
+
+    def replay():
+        f.seek(0)
+        while True:
+            try:
+                yield pickle.load(f)
+            except EOFError:
+                return
+    return replay
+
+
+def fragments(pages):
+    """Every fragment of every spooled page in {path: spool}."""
+    for replay in pages.values():
+        yield from replay()
+
+
+# ── SVG icon sprite ───────────────────────────────────────────────────────
+
+# Root <svg> attributes kept at each use site rather than on the <symbol>:
+# they reach the shapes by inheritance, so CSS such as `.icon-row a:hover svg`
+# keeps restyling the icons.
+_ICON_USE_ATTRS = ("viewBox", "width", "height", "fill", "stroke", "stroke-width", "stroke-linecap", "stroke-linejoin")
+
+SPRITE_FILE = "icons.svg"
+SPRITE_PRECISION = 2  # decimals kept in coordinates (icons use a 24-unit viewBox)
+
+# Attributes holding coordinates, the only ones whose numbers are rounded
+# (ids, hrefs and colours like #0000ff must stay as they are)
+_SVG_GEOMETRY_ATTRS = ("d", "points", "viewBox", "transform", "x", "y", "x1", "y1", "x2", "y2",
+                       "cx", "cy", "r", "rx", "ry", "width", "height")
+
+_SVG_RE = re.compile(r"<svg\b([^>]*)>(.*)</svg>", re.S)
+_SVG_ATTR_RE = re.compile(r'([\w:-]+)="([^"]*)"')
+_SVG_NUM_RE = re.compile(r"-?(?:\d+\.?\d*|\.\d+)")
+_ICON_REF_RE = re.compile(r'href="#i-([\w-]+)"')
+
+
+def _split_icon(svg):
+    attrs, inner = _SVG_RE.match(svg).groups()
+    return dict(_SVG_ATTR_RE.findall(attrs)), inner
+
+
+def icon(name, cls=""):
+    """Markup for ICONS[name] as a reference into the page's icon sprite."""
+    attrs, _ = _split_icon(ICONS[name])
+    kept = "".join(f' {k}="{v}"' for k, v in attrs.items() if k in _ICON_USE_ATTRS)
+    cls = f' class="{cls}"' if cls else ""
+    return Markup(f'<svg{cls}{kept}><use href="#i-{name}"/></svg>')
+
+
+def _round_numbers(value):
+    """Round the numbers in an SVG geometry attribute value to
+    SPRITE_PRECISION and drop redundant zeros, leaving the separators as
+    they are."""
+    def fmt(m):
+        text = f"{round(float(m[0]), SPRITE_PRECISION):.{SPRITE_PRECISION}f}".rstrip("0").rstrip(".")
+        if text in ("", "-", "-0"):
+            text = "0"
+        if "." not in text and value[m.end():m.end() + 1] == ".":
+            return m[0]  # "10.0.5" must not collapse into "10.5"
+        return text.replace("0.", ".", 1) if text.startswith(("0.", "-0.")) else text
+    return _SVG_NUM_RE.sub(fmt, value)
+
+
+def icon_sprite(names):
+    """Optimized <symbol> sprite holding the given icons."""
+    symbols = []
+    for name in names:
+        attrs, inner = _split_icon(ICONS[name])
+        inner = re.sub(r">\s+<", "><", inner.strip())
+        inner = _SVG_ATTR_RE.sub(
+            lambda m: f'{m[1]}="{_round_numbers(m[2])}"' if m[1] in _SVG_GEOMETRY_ATTRS else m[0], inner)
+        symbols.append(f'<symbol id="i-{name}" viewBox="{attrs["viewBox"]}">{inner}</symbol>')
+    return f'<svg xmlns="http://www.w3.org/2000/svg">{"".join(symbols)}</svg>'
+
+
+def icon_names(fragments):
+    """The names of the icons used anywhere in `fragments`, sorted."""
+    return sorted({name for html in fragments for name in _ICON_REF_RE.findall(html) if name in ICONS})
+
+
+def apply_icon_sprite(html, sprite, mode="inline"):
+    """Emit `sprite` (see icon_sprite) for a page fragment.
+
+    "inline" puts a hidden sprite at the top of the page's <body>;
+    "external" points every <use> at SPRITE_FILE instead (the sprite is
+    then published and fingerprinted like the other assets).
+    """
+    if mode == "external":
+        return _ICON_REF_RE.sub(rf'href="{SPRITE_FILE}#i-\1"', html)
+    inline = sprite.replace(' xmlns="http://www.w3.org/2000/svg"', ' style="display:none"', 1)
+    return re.sub(r"(<body\b[^>]*>\n)", lambda m: f"{m[1]}    {inline}\n", html, count=1)
+
+
+# ── Image pipeline ────────────────────────────────────────────────────────
+
+GEN_DIR = "assets/gen"
+CACHE_DIR = ".build-cache"
+
+# Worker processes/threads per pool; batch builds divide the CPUs between sites
+WORKERS = os.cpu_count() or 1
+
+# Directory of encoded images shared between sites (set for batch builds)
+SHARED_CACHE = None
 
+# Rendered widths are the CSS slot size at 1x/2x/3x (see .hero-photo and
+# .pub-thumb in style.css; thumbnails grow to 300px on mobile).
+IMAGE_PROFILES = {
+    "hero": {"widths": (200, 400, 600), "sizes": "(max-width: 768px) 160px, 200px", "lazy": False},
+    "thumb": {"widths": (180, 360, 600), "sizes": "(max-width: 768px) 300px, 180px", "lazy": True},
+}
+
+# The variants the current and the previous build link, for pruning
+VARIANTS_PATH = f"{GEN_DIR}/images.json"
+
+# Output formats in <source> preference order; the last one is the <img> fallback.
+IMAGE_FORMATS = (
+    ("avif", "image/avif", {"quality": 50}),
+    ("webp", "image/webp", {"quality": 80, "method": 6}),
+    ("jpeg", "image/jpeg", {"quality": 82, "optimize": True, "progressive": True}),
+)
+
+
+def collect_images(c):
+    """List the (path, profile) pairs for every image content.yaml references."""
+    jobs = [(c.get("photo", "assets/profile.jpg"), "hero")]
+    jobs += [(pub["thumbnail"], "thumb") for pub in c.get("publications", []) if pub.get("thumbnail")]
+    return list(dict.fromkeys(jobs))
+
+
+def _file_digest(path):
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()[:12]
+
+
+def _encode_image(src, profile, digest):
+    """Decode one source image and write its resized variants. Runs in a worker process."""
+    from PIL import Image, ImageOps
+
+    stem = os.path.splitext(os.path.basename(src))[0]
+    with Image.open(src) as im:
+        im = ImageOps.exif_transpose(im)
+        width, height = im.size
+        if im.mode not in ("RGB", "RGBA"):
+            im = im.convert("RGBA" if "transparency" in im.info or im.mode in ("LA", "PA") else "RGB")
+
+        widths = sorted({min(w, width) for w in IMAGE_PROFILES[profile]["widths"]})
+        variants = {}
+        for w in widths:
+            h = max(1, round(height * w / width))
+            frame = im.resize((w, h), Image.LANCZOS) if w != width else im
+            for fmt, _, opts in IMAGE_FORMATS:
+                out = frame
+                if fmt == "jpeg" and out.mode == "RGBA":
+                    out = Image.new("RGB", out.size, (255, 255, 255))
+                    out.paste(frame, mask=frame.getchannel("A"))
+                ext = "jpg" if fmt == "jpeg" else fmt
+                path = f"{GEN_DIR}/{stem}-{digest}-{w}w.{ext}"
+                try:
+                    out.save(path, fmt.upper(), **opts)
+                except (KeyError, OSError, ValueError):
+                    # Encoder not available in this Pillow build (typically AVIF)
+                    if os.path.exists(path):
+                        os.remove(path)
+                    continue
+                variants.setdefault(fmt, []).append([path, w, h])
+    return {"width": width, "height": height, "variants": variants}
+
+
+def _shared_fetch(key):
+    """Link a cached record's variants from SHARED_CACHE into GEN_DIR.
+    Returns the record, or None when the shared cache does not have it."""
+    try:
+        with open(os.path.join(SHARED_CACHE, key.replace(":", "-") + ".json"), "r", encoding="utf-8") as f:
+            rec = json.load(f)
+        os.makedirs(GEN_DIR, exist_ok=True)
+        for path, _, _ in (v for vs in rec["variants"].values() for v in vs):
+            if not os.path.exists(path):
+                src = os.path.join(SHARED_CACHE, os.path.basename(path))
+                try:
+                    os.link(src, path)
+                except OSError:
+                    shutil.copy2(src, path)
+    except (OSError, ValueError):
+        return None
+    return rec
+
+
+def _shared_store(key, rec):
+    os.makedirs(SHARED_CACHE, exist_ok=True)
+    for path, _, _ in (v for vs in rec["variants"].values() for v in vs):
+        dst = os.path.join(SHARED_CACHE, os.path.basename(path))
+        if not os.path.exists(dst):
+            with open(path, "rb") as f:
+                write_if_changed(dst, f.read())
+    # The record is written last, so readers never see one with missing files
+    write_if_changed(os.path.join(SHARED_CACHE, key.replace(":", "-") + ".json"), json.dumps(rec))
+
+
+def _shared_lock(key, block=True):
+    """Lock SHARED_CACHE's entry for `key`, so that sites of a batch built
+    at the same time encode a shared image once. Returns the locked file
+    (closing it releases the lock), or None when `block` is false and
+    another process holds the lock. Without fcntl (Windows) nothing is
+    locked and every site encodes what the cache does not have yet."""
+    try:
+        import fcntl
+    except ImportError:
+        return open(os.devnull, "rb")
+    os.makedirs(SHARED_CACHE, exist_ok=True)
+    f = open(os.path.join(SHARED_CACHE, key.replace(":", "-") + ".lock"), "ab")
+    try:
+        fcntl.flock(f, fcntl.LOCK_EX | (0 if block else fcntl.LOCK_NB))
+    except BlockingIOError:
+        f.close()
+        return None
+    return f
+
+
+def process_images(jobs):
+    """Run the image stage; returns {(path, profile): record}.
+
+    Variants are cached by source hash in .build-cache/images.json, so an
+    image is only re-encoded when its bytes change; with SHARED_CACHE set,
+    variants another site already encoded are reused too, and an image that
+    another site of the batch is encoding right now is waited for (see
+    _shared_lock) rather than encoded twice. As with
+    fingerprinted copies, the previous build's variants (listed in
+    VARIANTS_PATH) are kept for one more build and older ones removed, so
+    cached pages keep their images. Missing files and
+    builds without Pillow produce no record and fall back to a plain <img>.
+    """
+    try:
+        import PIL  # noqa: F401
+    except ImportError:
+        print("Pillow not installed — skipping image optimization (pip install pillow)")
+        return {}
+
+    cache_path = os.path.join(CACHE_DIR, "images.json")
+    try:
+        with open(cache_path, "r", encoding="utf-8") as f:
+            cache = json.load(f)
+    except (FileNotFoundError, ValueError):
+        cache = {}
+
+    images, pending, fetched = {}, [], False
+    for src, profile in jobs:
+        if not os.path.isfile(src):
+            print(f"  image not found, skipped: {src}")
+            continue
+        digest = _file_digest(src)
+        key = f"{digest}:{profile}"
+        rec = cache.get(key)
+        if rec and all(os.path.exists(v[0]) for vs in rec["variants"].values() for v in vs):
+            images[(src, profile)] = rec
+        elif SHARED_CACHE and (rec := _shared_fetch(key)):
+            cache[key] = images[(src, profile)] = rec
+            fetched = True
+        else:
+            pending.append((src, profile, digest, key))
+
+    def encode(jobs):
+        if not jobs:
+            return
+        os.makedirs(GEN_DIR, exist_ok=True)
+        from concurrent.futures import ProcessPoolExecutor
+
+        with ProcessPoolExecutor(max_workers=min(len(jobs), WORKERS)) as pool:
+            futures = [(src, profile, key, pool.submit(_encode_image, src, profile, digest))
+                       for src, profile, digest, key in jobs]
+            for src, profile, key, fut in futures:
+                try:
+                    rec = fut.result()
+                except Exception as e:
+                    print(f"  could not process {src}: {e}")
+                    continue
+                cache[key] = images[(src, profile)] = rec
+                if SHARED_CACHE:
+                    _shared_store(key, rec)
+                    if key in locks:
+                        locks.pop(key).close()
+                print(f"  encoded {src} ({profile}, {sum(len(v) for v in rec['variants'].values())} variants)")
+
+    locks, waiting = {}, []
+    try:
+        if SHARED_CACHE:
+            claimed = []
+            for src, profile, digest, key in pending:
+                lock = _shared_lock(key, block=False)
+                if lock is None:
+                    waiting.append((src, profile, digest, key))
+                    continue
+                locks[key] = lock
+                if rec := _shared_fetch(key):  # stored since the lookup above
+                    cache[key] = images[(src, profile)] = rec
+                    fetched = True
+                    locks.pop(key).close()
+                else:
+                    claimed.append((src, profile, digest, key))
+            pending = claimed
+        encode(pending)
+        # Images another site was encoding: once its lock is released the
+        # variants are in the shared cache (or, if it failed, encode them here)
+        for src, profile, digest, key in waiting:
+            with _shared_lock(key):
+                if rec := _shared_fetch(key):
+                    cache[key] = images[(src, profile)] = rec
+                    fetched = True
+                else:
+                    encode([(src, profile, digest, key)])
+    finally:
+        for lock in locks.values():
+            lock.close()
+    if pending or waiting or fetched:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        with open(cache_path, "w", encoding="utf-8") as f:
+            json.dump(cache, f, indent=1, sort_keys=True)
+    if os.path.isdir(GEN_DIR):
+        produced = {v[0] for rec in images.values() for vs in rec["variants"].values() for v in vs}
+        try:
+            with open(VARIANTS_PATH, "r", encoding="utf-8") as f:
+                record = json.load(f)
+        except (FileNotFoundError, ValueError):
+            record = {}
+        if produced != set(record.get("current", ())):
+            record = {"current": sorted(produced), "previous": record.get("current", [])}
+            write_if_changed(VARIANTS_PATH, json.dumps(record, indent=2) + "\n")
+        keep = produced | set(record["previous"])
+        for name in os.listdir(GEN_DIR):
+            path = f"{GEN_DIR}/{name}"
+            if re.search(r"-[0-9a-f]{12}-\d+w\.(?:avif|webp|jpg)$", name) and path not in keep:
+                os.remove(path)
+    return images
+
+
+def picture(src, alt, profile, images, attrs="", indent=""):
+    """Responsive <picture> markup for an image handled by the image stage.
+    `alt` is escaped; `attrs` is inserted as is."""
+    return Markup(_picture(src, alt, profile, images, attrs, indent))
+
+
+def _picture(src, alt, profile, images, attrs="", indent=""):
+    """picture() as a plain str, for templates."""
+    spec = IMAGE_PROFILES[profile]
+    alt = _ESCAPED[alt]
+    loading = ' loading="lazy"' if spec["lazy"] else ""
+    rec = images.get((src, profile)) if images else None
+    if not rec or "jpeg" not in rec["variants"]:
+        return f'<img src="{_ESCAPED[src]}" alt="{alt}"{loading} decoding="async"{attrs}>'
+
+    def srcset(fmt):
+        return ", ".join(f"{path} {w}w" for path, w, _ in rec["variants"][fmt])
+
+    fallback, width, height = rec["variants"]["jpeg"][0]
+    lines = ["<picture>"]
+    for fmt, mime, _ in IMAGE_FORMATS[:-1]:
+        if fmt in rec["variants"]:
+            lines.append(f'    <source type="{mime}" srcset="{srcset(fmt)}" sizes="{spec["sizes"]}">')
+    lines.append(
+        f'    <img src="{fallback}" srcset="{srcset("jpeg")}" sizes="{spec["sizes"]}" '
+        f'width="{width}" height="{height}" alt="{alt}"{loading} decoding="async"{attrs}>'
+    )
+    lines.append("</picture>")
+    return f"\n{indent}".join(lines)
+
+
+# ── Asset fingerprinting ──────────────────────────────────────────────────
+
+MANIFEST_PATH = f"{GEN_DIR}/manifest.json"
+PREVIOUS_MANIFEST_PATH = f"{GEN_DIR}/manifest.previous.json"
+
+_URL_ATTR_RE = re.compile(r'\b(href|src|srcset|imagesrcset)="([^"]*)"')
+
+
+def _is_local(url):
+    return bool(url) and not re.match(r"^(?:[a-z][a-z0-9+.-]*:|//|#)", url, re.I)
+
+
+def _map_urls(attr, value, fn):
+    """Apply fn to each URL in an attribute value (srcset holds several)."""
+    if not attr.endswith("srcset"):
+        return fn(value)
+    entries = []
+    for entry in value.split(","):
+        url, _, descriptor = entry.strip().partition(" ")
+        entries.append(f"{fn(url)} {descriptor}".rstrip())
+    return ", ".join(entries)
+
+
+def local_refs(html):
+    """Every local file path referenced from an href/src/srcset attribute."""
+    refs = []
+    for attr, value in _URL_ATTR_RE.findall(html):
+        _map_urls(attr, value, lambda url: refs.append(re.split(r"[?#]", url)[0]) if _is_local(url) else None)
+    return list(dict.fromkeys(refs))
+
+
+def fingerprint_assets(refs, overrides=None):
+    """Copy the referenced local files `refs` to GEN_DIR as name.<hash>.ext
+    and return the manifest {source path: copy}; see rewrite_urls().
+
+    `overrides` maps a source path to the bytes to publish in its place
+    (e.g. minified CSS); the hash is taken from those bytes. Files under
+    GEN_DIR are already content-addressed and left alone. Copies the
+    previous build referenced are kept for one more build, so pages still
+    cached from it keep working; older unreferenced copies are removed.
+    """
+    manifest = {}
+    for path in refs:
+        if path.startswith(GEN_DIR + "/"):
+            continue
+        data = (overrides or {}).get(path)
+        if data is None:
+            if not os.path.isfile(path):
+                continue
+            with open(path, "rb") as f:
+                data = f.read()
+        stem, ext = os.path.splitext(os.path.basename(path))
+        out = f"{GEN_DIR}/{stem}.{hashlib.sha256(data).hexdigest()[:10]}{ext}"
+        if not os.path.exists(out):
+            os.makedirs(GEN_DIR, exist_ok=True)
+            write_if_changed(out, data)
+        manifest[path] = out
+
+    def load(path):
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return {}
+
+    previous = load(MANIFEST_PATH)
+    if manifest != previous:
+        older = load(PREVIOUS_MANIFEST_PATH)
+        for stale in set(older.values()) - set(previous.values()) - set(manifest.values()):
+            if os.path.exists(stale):
+                os.remove(stale)
+        write_if_changed(PREVIOUS_MANIFEST_PATH, json.dumps(previous, indent=2, sort_keys=True) + "\n")
+        write_if_changed(MANIFEST_PATH, json.dumps(manifest, indent=2, sort_keys=True) + "\n")
+    return manifest
+
+
+def rewrite_urls(html, manifest, prefix=""):
+    """Point the local URLs of `html` (written from the site root) at their
+    fingerprinted copies; pages in subdirectories pass prefix "../"."""
+    def rewrite(url):
+        if not _is_local(url):
+            return url
+        path, suffix = re.match(r"([^?#]*)(.*)", url).groups()
+        target = manifest.get(path, path)
+        if prefix and target.startswith("./"):
+            target = target[2:]
+        return prefix + target + suffix
+
+    return _URL_ATTR_RE.sub(lambda m: f'{m[1]}="{_map_urls(m[1], m[2], rewrite)}"', html)
+
+
+# ── Optimization: minify + unused-CSS pruning ──────────────────────────────
+
+# Strings and comments, for CSS/JS scanning that must not look inside strings
+_CSS_STRING_OR_COMMENT_RE = re.compile(r'("(?:\\.|[^"\\])*"|\'(?:\\.|[^\'\\])*\')|/\*.*?\*/', re.S)
+
+# At-rules whose block holds ordinary rules that pruning should look into
+_NESTED_AT_RULES = ("@media", "@supports", "@container", "@layer", "@document")
+
+
+def _split_top(text, sep):
+    """Split on `sep` outside of quotes, parentheses and brackets."""
+    parts, depth, quote, start = [], 0, None, 0
+    for i, ch in enumerate(text):
+        if quote:
+            if ch == quote and text[i - 1] != "\\":
+                quote = None
+        elif ch in "\"'":
+            quote = ch
+        elif ch in "([":
+            depth += 1
+        elif ch in ")]":
+            depth -= 1
+        elif ch == sep and depth == 0:
+            parts.append(text[start:i])
+            start = i + 1
+    parts.append(text[start:])
+    return parts
+
+
+def _css_blocks(css):
+    """Split a stylesheet into top-level (prelude, body) pairs, dropping
+    comments. Body is None for statements such as @import."""
+    css = _CSS_STRING_OR_COMMENT_RE.sub(lambda m: m[1] or "", css)
+    blocks, depth, quote, start, open_at = [], 0, None, 0, 0
+    for i, ch in enumerate(css):
+        if quote:
+            if ch == quote and css[i - 1] != "\\":
+                quote = None
+        elif ch in "\"'":
+            quote = ch
+        elif ch == "{":
+            if depth == 0:
+                open_at = i
+            depth += 1
+        elif ch == "}":
+            depth -= 1
+            if depth == 0:
+                blocks.append((css[start:open_at].strip(), css[open_at + 1:i]))
+                start = i + 1
+        elif ch == ";" and depth == 0:
+            blocks.append((css[start:i].strip(), None))
+            start = i + 1
+    return blocks
+
+
+def used_names(*texts):
+    """Every identifier-like token in the given HTML/JS. Class names toggled
+    from scripts (e.g. 'open', 'scrolled') therefore count as used."""
+    names = set()
+    for text in texts:
+        names.update(re.findall(r"[A-Za-z_][\w-]*", text))
+    return names
+
+
+def _selector_used(selector, used, tags=None):
+    selector = re.sub(r":not\([^)]*\)|\[[^\]]*\]", "", selector)
+    if not all(name in used for name in re.findall(r"[.#](-?[A-Za-z_][\w-]*)", selector)):
+        return False
+    if tags is None:
+        return True
+    selector = re.sub(r"::?[\w-]+(\([^)]*\))?", "", selector)
+    return all(tag.lower() in tags for tag in re.findall(r"(?:^|[\s>+~])([A-Za-z][\w-]*)", selector))
+
+
+def prune_css(css, used, tags=None):
+    """Drop selectors whose classes/ids never occur in `used` (see used_names),
+    and rules or @media blocks left empty as a result. With `tags`, selectors
+    naming an element type outside that set are dropped as well."""
+    out = []
+    for prelude, body in _css_blocks(css):
+        if body is None:
+            out.append(prelude + ";")
+        elif prelude.startswith("@"):
+            if prelude.split()[0].lower() in _NESTED_AT_RULES:
+                body = prune_css(body, used, tags)
+                if not body.strip():
+                    continue
+            out.append(f"{prelude} {{{body}}}")
+        else:
+            selectors = [sel.strip() for sel in _split_top(prelude, ",") if _selector_used(sel, used, tags)]
+            if selectors:
+                out.append(f"{', '.join(selectors)} {{{body}}}")
+    return "\n".join(out)
+
+
+def _squash_css(text):
+    """Collapse whitespace outside strings and tighten it around punctuation."""
+    parts = re.split(r'("(?:\\.|[^"\\])*"|\'(?:\\.|[^\'\\])*\')', text)
+    for i in range(0, len(parts), 2):
+        part = re.sub(r"\s+", " ", parts[i])
+        parts[i] = re.sub(r"\s*([,>{}])\s*|(?<=[(:])\s+|\s+(?=\))", lambda m: m[1] or "", part)
+    return "".join(parts).strip()
+
+
+def minify_css(css):
+    out = []
+    for prelude, body in _css_blocks(css):
+        if body is None:
+            out.append(_squash_css(prelude) + ";")
+        elif "{" in body:
+            out.append(f"{_squash_css(prelude)}{{{minify_css(body)}}}")
+        else:
+            decls = [d for d in (_squash_css(d) for d in _split_top(body, ";")) if d]
+            if decls:
+                out.append(f"{_squash_css(prelude)}{{{';'.join(decls)}}}")
+    return "".join(out)
+
+
+_JS_WORD = re.compile(r"[\w$]")
+# After these (or at the start) a "/" begins a regex literal rather than a division
+_JS_REGEX_PREV = set("(,=:[!&|?{};+-*%<>~^")
+# A "/" after one of these words (but not after "margin" or "todo") starts a regex
+_JS_REGEX_KEYWORD_RE = re.compile(r"(?<![\w$])(?:return|typeof|case|do|else|in|of|new|delete|void|throw)$")
+
+
+def minify_js(js):
+    """Conservative JS minifier: drops comments and indentation and collapses
+    whitespace between tokens. Strings, template literals and regex literals
+    are copied verbatim. A line break is kept wherever removing it could
+    change automatic semicolon insertion."""
+    out, i, n = [], 0, len(js)
+
+    def last():
+        return out[-1][-1] if out and out[-1] else ""
+
+    while i < n:
+        ch = js[i]
+        if ch in "\"'`":
+            j = i + 1
+            while j < n and js[j] != ch:
+                j += 2 if js[j] == "\\" else 1
+            out.append(js[i:j + 1])
+            i = j + 1
+        elif js.startswith("//", i):
+            i = js.find("\n", i)
+            i = n if i < 0 else i
+        elif js.startswith("/*", i):
+            end = js.find("*/", i + 2)
+            i = n if end < 0 else end + 2
+            if not last().isspace():
+                out.append(" ")
+        elif ch == "/" and (not out or last() in _JS_REGEX_PREV or last() == "\n"
+                             or _JS_REGEX_KEYWORD_RE.search("".join(out[-16:]).rstrip())):
+            j, in_class = i + 1, False
+            while j < n and (js[j] != "/" or in_class):
+                if js[j] == "\\":
+                    j += 1
+                elif js[j] == "[":
+                    in_class = True
+                elif js[j] == "]":
+                    in_class = False
+                j += 1
+            j += 1
+            while j < n and _JS_WORD.match(js[j]):
+                j += 1
+            out.append(js[i:j])
+            i = j
+        elif ch.isspace():
+            j = i
+            while j < n and js[j].isspace():
+                j += 1
+            prev, nxt = last(), js[j] if j < n else ""
+            if not prev or not nxt or prev == "\n":
+                pass
+            elif "\n" in js[i:j] and prev not in "{([,;=:&|?!<>*%" and nxt not in "}),;.]?:=&|":
+                out.append("\n")
+            elif (_JS_WORD.match(prev) and _JS_WORD.match(nxt)) or (prev in "+-" and prev == nxt):
+                out.append(" ")
+            i = j
+        else:
+            if last() == " " and not _JS_WORD.match(ch) and ch not in "+-":
+                out[-1] = out[-1][:-1]
+            out.append(ch)
+            i += 1
+    return "".join(out).strip()
+
+
+_HTML_RAW_RE = re.compile(r"(<(script|style|pre|textarea)\b([^>]*)>)(.*?)(</\2>)", re.S | re.I)
+_HTML_BLOCK_TAGS = ("html|head|body|title|meta|link|base|div|p|ul|ol|li|section|nav|header|footer|main|"
+                    "h[1-6]|br|hr|picture|source|template|noscript|table|tr|td|th|form")
+
+
+def _squash_html(text):
+    text = re.sub(r"<!--(?!\[).*?-->", "", text, flags=re.S)
+    text = re.sub(r"\s+", " ", text)
+    return re.sub(rf"\s*(</?(?:{_HTML_BLOCK_TAGS})\b[^>]*>)\s*", r"\1", text)
+
+
+def minify_fragment(html):
+    """Collapse whitespace and drop comments in a fragment that starts and
+    ends next to block-level tags (see render_page). Whitespace is only
+    removed next to block-level tags, so inline text keeps its spacing;
+    <pre>/<textarea> are untouched and inline <script>/<style> are minified
+    as JS/CSS."""
+    parts, pos = [], 0
+    for m in _HTML_RAW_RE.finditer(html):
+        parts.append(_squash_html(html[pos:m.start()]).strip())
+        tag, attrs, body = m[2].lower(), m[3], m[4]
+        if tag == "style":
+            body = minify_css(body)
+        elif tag == "script" and not re.search(r'type="(?!module|text/javascript)', attrs):
+            body = minify_js(body)
+        parts.append(f"{m[1]}{body}{m[5]}")
+        pos = m.end()
+    parts.append(_squash_html(html[pos:]).strip())
+    return "".join(parts)
+
+
+def optimize_assets(fragments, js):
+    """Minified style.css, pruned to what the given rendered page fragments
+    and script bundle `js` use. Returns ({source path: bytes},
+    [(name, bytes before, bytes after)])."""
+    with open("style.css", "r", encoding="utf-8") as f:
+        css = f.read()
+    used = used_names(js)
+    for html in fragments:
+        used |= used_names(html)
+    out = {"style.css": minify_css(prune_css(css, used)).encode()}
+    return out, [("style.css", len(css.encode()), len(out["style.css"]))]
+
+
+def print_size_report(rows):
+    print(f"  {'file':<24}{'before':>10}{'after':>10}{'saved':>8}")
+    for name, before, after in rows:
+        saved = f"{(1 - after / before) * 100:.1f}%" if before else "-"
+        print(f"  {name:<24}{before:>10,}{after:>10,}{saved:>8}")
+
+
+# ── Feature-sliced main.js ────────────────────────────────────────────────
+
+# main.js is split into blocks by "// @feature <name>" lines, each running
+# to the next marker. The blocks of the features below are left out of the
+# published bundle when the site does not need them; other code always ships.
+_JS_FEATURE_RE = re.compile(r"^// @feature ([\w-]+)[ \t]*\n", re.M)
+
+
+def js_features(c, opts, pages=None):
+    """{optional main.js feature: whether this site needs it}. `pages`
+    (spooled pages) tells whether any section was deferred inert."""
+    return {
+        "lang-pages": opts.split_lang,
+        "lang-inline": not opts.split_lang,
+        "password": bool(c.get("password")) and any(lnk.get("protected") for lnk in c["links"]),
+        "pubs": bool(sharded_pubs(c)),
+        "sw": opts.service_worker and not opts.watch,
+        "defer": opts.defer_sections and any(DEFER_TEMPLATE in html for html in fragments(pages or {})),
+    }
+
+
+def bundle_js(js, features):
+    """`js` without the blocks of the features that are off in `features`.
+    Returns (bundle, [names of the features left out])."""
+    parts = _JS_FEATURE_RE.split(js)
+    out, dropped = [parts[0]], []
+    for name, block in zip(parts[1::2], parts[2::2]):
+        if features.get(name, True):
+            out.append(block)
+        else:
+            dropped.append(name)
+    return "".join(out), dropped
+
+
+# ── Self-hosted font subsets ──────────────────────────────────────────────
+
+# Family name style.css asks for; every vendored face is registered under it
+# so Latin and CJK files combine into one font via unicode-range.
+FONT_FAMILY = "Inter"
+
+# Vendored font files (TTF/OTF/WOFF2), in priority order. Files are grouped
+# by family name: a family is one variable file or one static file per
+# weight, and each code point is served by the first family that has a
+# glyph for it. Files that are missing are skipped; with none present (or
+# without fontTools) the page keeps loading Google Fonts.
+FONT_FILES = ("fonts/Inter.ttf", "fonts/NotoSansSC.ttf")
+
+# Weights style.css uses (and the Google Fonts link requests). A family
+# without a face for each of them is not self-hosted, since the browser
+# would synthesize the missing bold weights.
+FONT_WEIGHTS = (400, 500, 600, 700)
+
+_GOOGLE_FONTS_RE = re.compile(r'[ \t]*<link [^>]*fonts\.(?:googleapis|gstatic)\.com[^>]*>\n?')
+
+
+def page_codepoints(fragments):
+    """Code points of all visible text (and text-bearing attributes) in the
+    rendered page fragments, plus printable ASCII for script-inserted text."""
+    cps = set(range(0x20, 0x7F))
+    for html in fragments:
+        html = re.sub(r"<(script|style)\b.*?</\1>", " ", html, flags=re.S | re.I)
+        attrs = re.findall(r'\b(?:placeholder|title|alt|aria-label)="([^"]*)"', html)
+        text = html_mod.unescape(re.sub(r"<[^>]+>", " ", html) + " ".join(attrs))
+        cps.update(ord(ch) for ch in text if ord(ch) >= 0x20)
+    return cps
+
+
+def _unicode_range(cps):
+    ranges, cps = [], sorted(cps)
+    start = prev = cps[0]
+    for cp in cps[1:] + [None]:
+        if cp is not None and cp == prev + 1:
+            prev = cp
+            continue
+        ranges.append(f"U+{start:X}" if start == prev else f"U+{start:X}-{prev:X}")
+        if cp is not None:
+            start = prev = cp
+    return ", ".join(ranges)
+
+
+def _font_weights(font):
+    """(lightest, boldest) weight a fontTools TTFont provides."""
+    if "fvar" in font and any(a.axisTag == "wght" for a in font["fvar"].axes):
+        axis = next(a for a in font["fvar"].axes if a.axisTag == "wght")
+        return axis.minValue, axis.maxValue
+    return (font["OS/2"].usWeightClass,) * 2
+
+
+def _subset_font(src, cps, digest):
+    """Subset one font file to `cps` as WOFF2. Runs in a worker process."""
+    from fontTools import subset
+    from fontTools.ttLib import TTFont
+
+    font = TTFont(src)
+    low, high = _font_weights(font)
+    weight = f"{low:g} {high:g}" if low != high else f"{low:g}"
+    options = subset.Options()
+    options.flavor = "woff2"
+    options.layout_features = ["*"]
+    options.name_IDs = []
+    subsetter = subset.Subsetter(options)
+    subsetter.populate(unicodes=cps)
+    subsetter.subset(font)
+    stem = os.path.splitext(os.path.basename(src))[0]
+    path = f"{GEN_DIR}/{stem}-{digest}.woff2"
+    font.save(path)
+    return {"path": path, "weight": weight, "range": _unicode_range(cps)}
+
+
+def process_fonts(cps, files=FONT_FILES):
+    """Subset the vendored fonts to the code points in `cps`.
+
+    Returns a list of face records ({path, weight, range}), the regular
+    face of the first family first, or an empty list when there is nothing
+    to self-host: no file could be subset, or the first family lacks a face
+    for one of FONT_WEIGHTS (later families missing a weight are skipped).
+    Subsets are cached by source and code-point hash in
+    .build-cache/fonts.json.
+    """
+    files = [f for f in files if os.path.isfile(f)]
+    if not files:
+        return []
+    try:
+        from fontTools.ttLib import TTFont
+    except ImportError:
+        print("fontTools not installed — keeping Google Fonts (pip install fonttools brotli)")
+        return []
 
-def bi_block(tag, cls, val):
-    """Two block-level elements for en/zh."""
-    return (
-        f'<{tag} class="{cls} lang-en">{val["en"]}</{tag}>\n'
-        f'                    <{tag} class="{cls} lang-zh">{val["zh"]}</{tag}>'
+    cache_path = os.path.join(CACHE_DIR, "fonts.json")
+    try:
+        with open(cache_path, "r", encoding="utf-8") as f:
+            cache = json.load(f)
+    except (FileNotFoundError, ValueError):
+        cache = {}
+
+    # {family: [(src, weights, cmap)]}, in the order the families first appear
+    families = {}
+    for src in files:
+        with TTFont(src, lazy=True) as font:
+            family = font["name"].getBestFamilyName()
+            families.setdefault(family, []).append((src, _font_weights(font), set(font.getBestCmap())))
+    primary = next(iter(families))
+    for family, members in list(families.items()):
+        missing = [w for w in FONT_WEIGHTS if not any(low <= w <= high for _, (low, high), _ in members)]
+        if missing:
+            print(f"  {family} ({', '.join(src for src, _, _ in members)}) has no face for weight "
+                  f"{', '.join(map(str, missing))} — not self-hosted; add those weights or a variable font")
+            del families[family]
+        else:
+            # The face for regular text first, so that it is the one preloaded
+            members.sort(key=lambda m: not m[1][0] <= 400 <= m[1][1])
+    if primary not in families:
+        print("  keeping Google Fonts")
+        return []
+
+    # Assign each code point to the first family that covers it
+    remaining, jobs = set(cps), []
+    for members in families.values():
+        assigned = remaining & set.union(*(cmap for _, _, cmap in members))
+        remaining -= assigned
+        for src, _, cmap in members:
+            covered = sorted(assigned & cmap)
+            if covered:
+                digest = hashlib.sha256(f"{_file_digest(src)}:{covered}".encode()).hexdigest()[:12]
+                jobs.append((src, covered, digest))
+
+    faces, pending = [], []
+    for src, covered, digest in jobs:
+        rec = cache.get(digest)
+        if rec and os.path.exists(rec["path"]):
+            faces.append(rec)
+        else:
+            faces.append(None)
+            pending.append((len(faces) - 1, src, covered, digest))
+    if pending:
+        os.makedirs(GEN_DIR, exist_ok=True)
+        from concurrent.futures import ProcessPoolExecutor
+
+        with ProcessPoolExecutor(max_workers=min(len(pending), WORKERS)) as pool:
+            futures = [(i, src, digest, pool.submit(_subset_font, src, covered, digest))
+                       for i, src, covered, digest in pending]
+            for i, src, digest, fut in futures:
+                try:
+                    faces[i] = cache[digest] = fut.result()
+                    print(f"  subset {src} → {faces[i]['path']} ({os.path.getsize(faces[i]['path']):,} bytes)")
+                except Exception as e:
+                    print(f"  could not subset {src}: {e}")
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        write_if_changed(cache_path, json.dumps(cache, indent=1, sort_keys=True))
+    return [face for face in faces if face]
+
+
+def apply_fonts(html, faces, base=""):
+    """Replace the Google Fonts links with @font-face rules for the subsets.
+    `base` prefixes the font URLs for pages in subdirectories."""
+    rules = "".join(
+        f"@font-face{{font-family:'{FONT_FAMILY}';font-style:normal;font-weight:{face['weight']};"
+        f"font-display:swap;src:url({base}{face['path']}) format('woff2');unicode-range:{face['range']}}}"
+        for face in faces
     )
+    # Preload the first (regular Latin) face only; the others load on demand by unicode-range
+    block = (f'    <link rel="preload" as="font" type="font/woff2" href="{faces[0]["path"]}" crossorigin>\n'
+             f'    <style>{rules}</style>\n')
+    m = _GOOGLE_FONTS_RE.search(html)
+    if not m:
+        return html.replace("</head>", block + "</head>", 1)
+    return _GOOGLE_FONTS_RE.sub("", html[:m.start()]) + block + _GOOGLE_FONTS_RE.sub("", html[m.start():])
+
+
+# ── Critical rendering path ───────────────────────────────────────────────
+
+# Markup visible on first paint: the fixed navbar and the hero section
+_ABOVE_FOLD_RE = re.compile(r'<nav\b.*?</nav>|<section class="hero".*?</section>', re.S)
+
+# Classes set on <html>/<body> by script before or right after first paint
+CRITICAL_STATE_CLASSES = ("dark", "zh")
+
+
+def critical_css(css, html):
+    """The rules of `css` that can match the above-the-fold markup of `html`."""
+    fold = "".join(_ABOVE_FOLD_RE.findall(html))
+    tags = {"html", "body", *(t.lower() for t in re.findall(r"<([A-Za-z][\w-]*)", fold))}
+    used = set(CRITICAL_STATE_CLASSES)
+    for attr in re.findall(r'\b(?:class|id)="([^"]*)"', fold):
+        used.update(attr.split())
+    return minify_css(prune_css(css, used, tags))
+
+
+def hero_preload(c, images):
+    """<link rel=preload> for the hero photo, matching the <picture> source
+    the browser will pick (the type attribute makes browsers that cannot
+    decode the format skip the preload instead of fetching a wasted file)."""
+    rec = (images or {}).get((c.get("photo", "assets/profile.jpg"), "hero"))
+    if not rec:
+        return f'<link rel="preload" as="image" href="{c.get("photo", "assets/profile.jpg")}" fetchpriority="high">'
+    for fmt, mime, _ in IMAGE_FORMATS:
+        if fmt in rec["variants"]:
+            variants = rec["variants"][fmt]
+            type_attr = f' type="{mime}"' if fmt != "jpeg" else ""
+            srcset = ", ".join(f"{path} {w}w" for path, w, _ in variants)
+            return (f'<link rel="preload" as="image" href="{variants[0][0]}" imagesrcset="{srcset}" '
+                    f'imagesizes="{IMAGE_PROFILES["hero"]["sizes"]}"{type_attr} fetchpriority="high">')
+    return ""
+
+
+def apply_critical_path(html, css, preload=""):
+    """Inline the above-the-fold CSS, load every stylesheet asynchronously
+    (with a <noscript> fallback) and prioritise the hero image."""
+    def async_link(m):
+        attrs = m[1].replace('rel="stylesheet"', "").strip()
+        return (f'<link rel="preload" as="style" {attrs} onload="this.onload=null;this.rel=\'stylesheet\'">\n'
+                f'    <noscript>{m[0]}</noscript>')
+
+    head, sep, body = html.partition("</head>")
+    head, count = re.subn(r'<link ([^>]*rel="stylesheet"[^>]*)>', async_link, head)
+    if not count:
+        return html
+    first = head.index('<link rel="preload" as="style"')
+    head = f"{head[:first]}<style>{critical_css(css, html)}</style>\n    {preload}\n    {head[first:]}"
+    photo = body.find('class="hero-photo"')
+    if photo >= 0:
+        img = body.find("<img ", photo)
+        body = body[:img + 5] + 'fetchpriority="high" ' + body[img + 5:]
+    return head + sep + body
+
+
+# ── Templates ─────────────────────────────────────────────────────────────
+#
+# The page layout and the section markup live in templates/*.html:
+#
+#   {{ expr }}            a Python expression, HTML-escaped unless it is Markup
+#   {{ expr|safe }}       a Python expression, emitted as is
+#   {% args a, b=None %}  the parameters of the render function
+#   {% for x in expr %} ... {% endfor %}
+#   {% if expr %} ... {% elif expr %} ... {% else %} ... {% endif %}
+#   {% set name = expr %}
+#   {% flush %}           end the current fragment once TEMPLATE_FLUSH
+#                         pieces are pending (see render_page)
+#   {% include expr %}    the fragments of expr, inline
+#   {% stream expr %}     the fragments of expr, each as its own fragment
+#   {# comment #}
+#
+# A {% %} or {# #} tag alone on its line takes the whole line with it. Each
+# template compiles to a generator function whose runs of text and {{ }}
+# become single f-strings; the compiled code is cached in TEMPLATE_CACHE,
+# keyed by the template's hash.
+
+TEMPLATE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "templates")
+TEMPLATE_CACHE = os.path.join(CACHE_DIR, "templates")
+TEMPLATE_ENGINE = "5"  # bump when compile_template() output changes
+TEMPLATE_FLUSH = 32  # pieces of output pending before {% flush %} ends a fragment
+
+_TEMPLATE_LINE_RE = re.compile(r"^[ \t]*(\{%(?:(?!%\}).)*%\}|\{#(?:(?!#\}).)*#\})[ \t]*(?:\n|\Z)", re.M | re.S)
+_TEMPLATE_TAG_RE = re.compile(r"\{\{(.*?)\}\}|\{%(.*?)%\}|\{#.*?#\}", re.S)
+
+_TEMPLATES = {}
+
+
+class TemplateError(Exception):
+    pass
+
+
+def _fstring(run):
+    """A Python f-string literal for a run of ("text" | "esc" | "raw", value)."""
+    out = []
+    for kind, value in run:
+        if kind == "text":
+            out.append(value.replace("\\", "\\\\").replace("'", "\\'").replace("\n", "\\n")
+                       .replace("{", "{{").replace("}", "}}"))
+        else:
+            out.append(f"{{_e[{value}]}}" if kind == "esc" else f"{{({value})}}")
+    return "f'''" + "".join(out) + "'''"
+
+
+# Template globals that return Markup, each mapped to the function a
+# {{ call(...) }} of it compiles to: its output is emitted without the escape
+# check, bi(), bi_block() and picture() without building the Markup object,
+# and bi() and bi_block() of a page with both languages as a lookup in
+# _BILINGUAL without a call.
+_MARKUP_HELPERS = {"Markup": "Markup", "bi": "_bi", "bi_block": "_bi_block", "icon": "icon", "picture": "_picture"}
+
+
+def _markup_call(expr):
+    """`expr` compiled for direct output if it is a call to one of
+    _MARKUP_HELPERS, else None."""
+    import ast
+
+    try:
+        node = ast.parse(expr, mode="eval").body
+    except SyntaxError:
+        return None
+    if not (isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and node.func.id in _MARKUP_HELPERS):
+        return None
+    args = [ast.get_source_segment(expr, arg) for arg in node.args]
+    if node.func.id == "bi" and 1 <= len(args) <= 2 and not node.keywords:
+        val, lang = (args + ["None"])[:2]
+        return f'_s[_bv["en"], _bv["zh"]] if (_bv := {val}).__class__ is dict and not {lang} else _bi(_bv, {lang})'
+    if node.func.id == "bi_block" and 3 <= len(args) <= 4 and not node.keywords:
+        tag, cls, val, lang = (args + ["None"])[:4]
+        return f'_bi_block({tag}, {cls}, {val}, {lang}) if {lang} else _s[{tag}, {cls}, (_bv := {val})["en"], _bv["zh"]]'
+    return _MARKUP_HELPERS[node.func.id] + expr[len(node.func.id):]
+
+
+def compile_template(source, name="<template>"):
+    """Python source of `def render(...)`, a generator yielding the
+    template's output fragment by fragment."""
+    source = _TEMPLATE_LINE_RE.sub(r"\1", source)
+    body, run, blocks, args = [], [], [], ""
+
+    def emit(code):
+        body.append("    " * (len(blocks) + 1) + code)
+
+    def end_run():
+        if run:
+            emit(f"_a({_fstring(run)})")
+            run.clear()
+
+    def flush(pieces=1):
+        end_run()
+        emit("if _p:" if pieces == 1 else f"if len(_p) >= {pieces}:")
+        emit("    yield ''.join(_p)")
+        emit("    _p.clear()")
+
+    pos = 0
+    for m in _TEMPLATE_TAG_RE.finditer(source):
+        if m.start() > pos:
+            run.append(("text", source[pos:m.start()]))
+        pos = m.end()
+        where = f"{name}:{source.count(chr(10), 0, m.start()) + 1}"
+        if m[1] is not None:
+            expr = m[1].strip()
+            if "\\" in expr or "'''" in expr:
+                raise TemplateError(f"{where}: no backslashes or ''' in {{{{ {expr} }}}}")
+            if expr.endswith("|safe"):
+                run.append(("raw", expr[:-5].rstrip()))
+            else:
+                call = _markup_call(expr)
+                run.append(("raw", call) if call else ("esc", expr))
+            continue
+        if m[2] is None:
+            continue
+        word, _, rest = m[2].strip().partition(" ")
+        rest = rest.strip()
+        if word == "args":
+            args = rest
+            continue
+        end_run()
+        if word in ("for", "if"):
+            emit(f"{word} {rest}:")
+            blocks.append((word, where))
+            emit("pass")
+        elif word in ("elif", "else"):
+            if not blocks or blocks[-1][0] != "if":
+                raise TemplateError(f"{where}: {{% {word} %}} outside {{% if %}}")
+            body.append("    " * len(blocks) + (f"elif {rest}:" if word == "elif" else "else:"))
+            emit("pass")
+        elif word in ("endfor", "endif"):
+            if not blocks or blocks[-1][0] != word[3:]:
+                raise TemplateError(f"{where}: unexpected {{% {word} %}}")
+            blocks.pop()
+        elif word == "set":
+            emit(rest)
+        elif word == "flush":
+            flush(TEMPLATE_FLUSH)
+        elif word == "include":
+            emit(f"_p.extend({rest})")
+        elif word == "stream":
+            flush()
+            emit(f"yield from {rest}")
+        else:
+            raise TemplateError(f"{where}: unknown tag {{% {word} %}}")
+    if pos < len(source):
+        run.append(("text", source[pos:]))
+    if blocks:
+        raise TemplateError(f"{blocks[-1][1]}: {{% {blocks[-1][0]} %}} is never closed")
+    flush()
+    return "\n".join([f"def render({args}):", "    _p = []", "    _a = _p.append", *body]) + "\n"
+
+
+def _template_globals():
+    return {"_e": _ESCAPED, "_s": _BILINGUAL, "Markup": Markup, "bi": bi, "_bi": _bi, "bi_block": bi_block, "_bi_block": _bi_block,
+            "icon": icon, "picture": picture, "_picture": _picture, "page_url": page_url, "ICONS": ICONS, "LABELS": LABELS, "LANGS": LANGS,
+            "PUB_SHARD_SIZE": PUB_SHARD_SIZE}
+
+
+def template_source(name):
+    with open(os.path.join(TEMPLATE_DIR, name), "r", encoding="utf-8") as f:
+        return f.read()
+
+
+def template(name):
+    """The render function of templates/<name>. Compiled code is kept per
+    process (until the file changes) and in TEMPLATE_CACHE, keyed by a hash
+    of the template, so an edited template is recompiled on its next use."""
+    st = os.stat(os.path.join(TEMPLATE_DIR, name))
+    stamp = (st.st_mtime_ns, st.st_size)
+    hit = _TEMPLATES.get(name)
+    if hit and hit[0] == stamp:
+        return hit[1]
+    source = template_source(name)
+    key = hashlib.sha256(f"{TEMPLATE_ENGINE}\0{sys.implementation.cache_tag}\0{source}".encode()).hexdigest()[:16]
+    path = os.path.join(TEMPLATE_CACHE, f"{name}.{key}.marshal")
+    try:
+        with open(path, "rb") as f:
+            code = marshal.loads(f.read())
+    except (OSError, ValueError, EOFError, TypeError):
+        code = compile(compile_template(source, name), os.path.join(TEMPLATE_DIR, name), "exec")
+        os.makedirs(TEMPLATE_CACHE, exist_ok=True)
+        for old in glob.glob(os.path.join(glob.escape(TEMPLATE_CACHE), glob.escape(name) + ".*.marshal")):
+            os.remove(old)
+        write_if_changed(path, marshal.dumps(code))
+    namespace = _template_globals()
+    exec(code, namespace)
+    fn = namespace["render"]
+    _TEMPLATES[name] = (stamp, fn)
+    return fn
 
 
 # ── Section builders ──────────────────────────────────────────────────────
 
-def build_stats(stats):
-    parts = []
-    for i, s in enumerate(stats):
-        if i > 0:
-            parts.append('                        <div class="stat-divider"></div>')
-        unit = f'<span class="stat-unit">{s["unit"]}</span>' if s.get("unit") else ""
-        parts.append(
-            f'                        <div class="stat">\n'
-            f'                            <span class="stat-value">{s["value"]}{unit}</span>\n'
-            f'                            <span class="stat-label">{bi(s["label"])}</span>\n'
-            f'                        </div>'
-        )
-    return "\n".join(parts)
-
-
-def build_links(links):
-    parts = []
-    for lnk in links:
-        icon_svg = ICONS.get(lnk["icon"], "")
-        target = ' target="_blank" rel="noopener"' if not lnk["url"].startswith("mailto:") else ""
-        label = bi(lnk["label"])
-        protected = ' data-protected' if lnk.get("protected") else ""
-        parts.append(
-            f'                        <a href="{lnk["url"]}"{target}{protected} title="{lnk.get("title", "")}">\n'
-            f'                            {icon_svg}\n'
-            f'                            <span>{label}</span>\n'
-            f'                        </a>'
-        )
-    return "\n".join(parts)
-
-
-def build_research(research):
-    en_paras = "\n                ".join(f"<p>{p}</p>" for p in research["en"])
-    zh_paras = "\n                ".join(f"<p>{p}</p>" for p in research["zh"])
-    return (
-        f'            <div class="research-content lang-en">\n'
-        f'                {en_paras}\n'
-        f'            </div>\n'
-        f'            <div class="research-content lang-zh">\n'
-        f'                {zh_paras}\n'
-        f'            </div>'
-    )
+def build_stats(stats, lang=None):
+    return template("stats.html")(stats, lang)
 
 
-def build_publications(pubs):
-    items = []
-    for pub in pubs:
-        thumb_links = "\n                            ".join(
-            f'<a href="{l["url"]}" class="pub-link" target="_blank" rel="noopener">{l["label"]}</a>'
-            for l in pub.get("links", [])
-        )
-        eq = f'\n                        <p class="pub-equal">{pub["equal_contribution"]}</p>' if pub.get("equal_contribution") else ""
-        items.append(
-            f'                <div class="pub-item">\n'
-            f'                    <div class="pub-thumb">\n'
-            f'                        <img src="{pub["thumbnail"]}" alt="{html_mod.escape(pub["title"][:20])}" onerror="this.style.display=\'none\'; this.parentElement.classList.add(\'thumb-placeholder-active\');">\n'
-            f'                        <div class="thumb-placeholder">\n'
-            f'                            <svg viewBox="0 0 160 100" xmlns="http://www.w3.org/2000/svg">\n'
-            f'                                <rect width="160" height="100" fill="#e9ecef" rx="4"/>\n'
-            f'                                <text x="80" y="50" text-anchor="middle" dominant-baseline="middle" fill="#adb5bd" font-size="12" font-family="Inter, sans-serif">Paper</text>\n'
-            f'                            </svg>\n'
-            f'                        </div>\n'
-            f'                    </div>\n'
-            f'                    <div class="pub-details">\n'
-            f'                        <h3 class="pub-title">\n'
-            f'                            <a href="{pub["links"][0]["url"]}" target="_blank" rel="noopener">{pub["title"]}</a>\n'
-            f'                        </h3>\n'
-            f'                        <p class="pub-authors">{pub["authors"]}</p>{eq}\n'
-            f'                        <p class="pub-venue">{pub["venue"]}</p>\n'
-            f'                        <div class="pub-links">\n'
-            f'                            {thumb_links}\n'
-            f'                        </div>\n'
-            f'                    </div>\n'
-            f'                </div>'
-        )
-    return "\n".join(items)
-
-
-def build_research_experience(exps):
-    items = []
-    for exp in exps:
-        en_details = "\n                        ".join(f"<li>{d}</li>" for d in exp["details"]["en"])
-        zh_details = "\n                        ".join(f"<li>{d}</li>" for d in exp["details"]["zh"])
-        items.append(
-            f'                <div class="resexp-item">\n'
-            f'                    <div class="resexp-header">\n'
-            f'                        <div>\n'
-            f'                            <h3 class="resexp-role">{bi(exp["role"])}</h3>\n'
-            f'                            <p class="resexp-org"><a href="{exp["org"]["url"]}" target="_blank" rel="noopener">{exp["org"]["name"]}</a>, {bi(exp["org"]["affiliation"])}</p>\n'
-            f'                            <p class="resexp-advisor">{bi(exp["advisor"])}</p>\n'
-            f'                        </div>\n'
-            f'                        <span class="resexp-date">{exp["date"]}</span>\n'
-            f'                    </div>\n'
-            f'                    <ul class="resexp-details lang-en">\n'
-            f'                        {en_details}\n'
-            f'                    </ul>\n'
-            f'                    <ul class="resexp-details lang-zh">\n'
-            f'                        {zh_details}\n'
-            f'                    </ul>\n'
-            f'                </div>'
-        )
-    return "\n".join(items)
-
-
-def build_honors(honors):
-    items = []
-    for h in honors:
-        items.append(
-            f'                <li>\n'
-            f'                    <span class="honor-name">{bi(h["name"])}</span>\n'
-            f'                    <span class="honor-note">{bi(h["note"])}</span>\n'
-            f'                    <span class="honor-year">{h["year"]}</span>\n'
-            f'                </li>'
-        )
-    return "\n".join(items)
-
-
-def build_leadership(leaders, social_practice):
-    items = []
-    for l in leaders:
-        items.append(
-            f'                <div class="exp-item">\n'
-            f'                    <div class="exp-header">\n'
-            f'                        <span class="exp-role">{bi(l["role"])}</span>\n'
-            f'                        <span class="exp-date">{l["date"]}</span>\n'
-            f'                    </div>\n'
-            f'                    {bi_block("p", "exp-desc", l["desc"])}\n'
-            f'                </div>'
-        )
-    leader_html = "\n".join(items)
-
-    sp_html = bi_block("p", "exp-desc", social_practice)
-
-    return (
-        f'            <div class="exp-category">\n'
-        f'{leader_html}\n'
-        f'            </div>\n\n'
-        f'            <div class="exp-category">\n'
-        f'                <h3 class="exp-heading"><span class="lang-en">Social Practice</span><span class="lang-zh">社会实践</span></h3>\n'
-        f'                <div class="exp-item">\n'
-        f'                    {sp_html}\n'
-        f'                </div>\n'
-        f'            </div>'
-    )
+def build_links(links, lang=None):
+    return template("links.html")(links, lang)
+
+
+def build_research(research, lang=None):
+    return template("research.html")(research, lang)
+
+
+def build_publications(pubs, images=None, lang=None):
+    return template("publications.html")(pubs, images, lang)
+
+
+def build_research_experience(exps, lang=None):
+    return template("research_experience.html")(exps, lang)
+
+
+def build_honors(honors, lang=None):
+    return template("honors.html")(honors, lang)
+
+
+def build_leadership(leaders, social_practice, lang=None):
+    return template("leadership.html")(leaders, social_practice, lang)
+
+
+# ── Incremental fragment cache ────────────────────────────────────────────
+
+FRAGMENT_CACHE = os.path.join(CACHE_DIR, "fragments.json")
+
+# Section name -> (builder, function selecting the builder's arguments).
+SECTIONS = {
+    "stats": (build_stats, lambda c, images: (c["stats"],)),
+    "links": (build_links, lambda c, images: (c["links"],)),
+    "research": (build_research, lambda c, images: (c["research"],)),
+    "publications": (build_publications, lambda c, images: (c["publications"][:c.get("publications_inline")], images)),
+    "research_experience": (build_research_experience, lambda c, images: (c["research_experience"],)),
+    "honors": (build_honors, lambda c, images: (c["honors"],)),
+    "leadership": (build_leadership, lambda c, images: (c["leadership"], c["social_practice"])),
+}
+
+@functools.lru_cache(maxsize=None)
+def _module_version():
+    """Hash of build.py and the tables fragments are rendered with. The code
+    cannot change while the process runs, so it is computed once."""
+    with open(os.path.abspath(__file__), "rb") as f:
+        data = f.read()
+    data += (TEMPLATE_ENGINE + repr(ICONS) + repr(LABELS) + repr(_MARKUP_HELPERS) + repr(IMAGE_PROFILES)).encode()
+    return hashlib.sha256(data).hexdigest()
+
+
+def _code_version(builder):
+    """Hash of the builder code (see _module_version) and its template, which
+    may be edited between builds of one --watch session."""
+    src = template_source(builder.__name__[len("build_"):] + ".html")
+    return hashlib.sha256((_module_version() + src).encode()).hexdigest()
+
+
+def _canonical(obj):
+    """Order-independent form of a section's inputs, for hashing."""
+    if isinstance(obj, dict):
+        return sorted((repr(k), _canonical(v)) for k, v in obj.items())
+    if isinstance(obj, (list, tuple)):
+        return [_canonical(v) for v in obj]
+    return obj
+
+
+def load_fragment_cache():
+    try:
+        with open(FRAGMENT_CACHE, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+def save_fragment_cache(cache):
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    write_if_changed(FRAGMENT_CACHE, json.dumps(cache, ensure_ascii=False, sort_keys=True))
+
+
+def render_sections(c, images=None, cache=None, lang=None):
+    """Render every section, returning {name: iterable of html fragments}.
+
+    Without a cache the builders' generators are returned as they are, so a
+    section is rendered only as the page is streamed. When `cache` (a dict,
+    see load_fragment_cache) is given, a section is only re-rendered if the
+    hash of its input subtree or its builder's code changed; fresh
+    fragments are stored back into `cache`.
+    """
+    out, rendered = {}, []
+    for name, (builder, select) in SECTIONS.items():
+        args = select(c, images)
+        if cache is None:
+            out[name] = timed_iter(f"section:{name}", builder(*args, lang=lang))
+            continue
+        key = hashlib.sha256((_code_version(builder) + repr(_canonical(args))).encode()).hexdigest()
+        slot = f"{name}:{lang}" if lang else name
+        entry = cache.get(slot)
+        if entry and entry["key"] == key:
+            out[name] = (entry["html"],)
+        else:
+            with timed(f"section:{name}"):
+                html = "".join(builder(*args, lang=lang))
+            cache[slot] = {"key": key, "html": html}
+            out[name] = (html,)
+            rendered.append(slot)
+    if cache is not None:
+        print(f"  re-rendered {len(rendered)}/{len(SECTIONS)} sections{f' ({lang})' if lang else ''}" + (f": {', '.join(rendered)}" if rendered else ""))
+    return out
+
+
+# ── Sharded publication list ──────────────────────────────────────────────
+
+# With `publications_inline: N` in content.yaml only the first N publications
+# are in the page; the rest are published as JSON shards of pre-rendered
+# items that main.js loads on scroll or search, plus an inverted index.
+PUB_SHARD_SIZE = 50
+
+# Key of the pseudo-page that carries a page's shard items through the page
+# stages (fonts, pruning, fingerprinting, minification), one item per fragment
+PUB_ITEMS = "#pubs"
+
+
+def sharded_pubs(c):
+    """The publications that go to shards (empty when all are inline)."""
+    inline = c.get("publications_inline")
+    return c["publications"][inline:] if inline is not None else []
+
+
+def pub_items(c, images, lang=None):
+    """The rendered items of the sharded publications, one per fragment."""
+    render = template("publications.html")
+    for pub in sharded_pubs(c):
+        yield "".join(render([pub], images, lang)).strip()
+
+
+def _tokens(text):
+    text = html_mod.unescape(re.sub(r"<[^>]+>", " ", text)).lower()
+    return re.findall(r"[a-z0-9]+|[^\x00-\x7f\s]", text)
+
+
+def pub_index(pubs):
+    """Inverted index {word: [publication numbers]} over title, authors and venue."""
+    index = {}
+    for i, pub in enumerate(pubs):
+        for word in dict.fromkeys(_tokens(" ".join((pub["title"], pub["authors"], pub["venue"])))):
+            index.setdefault(word, []).append(i)
+    return dict(sorted(index.items()))
+
+
+def write_pub_shards(c, pages):
+    """Move the shard items out of `pages` into hashed JSON shards in
+    GEN_DIR, PUB_SHARD_SIZE items at a time. Shards and indexes from
+    earlier builds are removed. Returns {page: the data-shards/data-index
+    attributes pointing its publication list at them}."""
+    items = {key[:-len(PUB_ITEMS)]: pages.pop(key) for key in list(pages) if key.endswith(PUB_ITEMS)}
+    if not items:
+        return {}
+
+    def publish(prefix, data):
+        data = json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode()
+        path = f"{GEN_DIR}/{prefix}-{hashlib.sha256(data).hexdigest()[:10]}.json"
+        write_if_changed(path, data)
+        return path
+
+    os.makedirs(GEN_DIR, exist_ok=True)
+    index = publish("pubs-index", pub_index(c["publications"]))
+    written = {index}
+    attrs = {}
+    for page, fragments in items.items():
+        shards, shard = [], []
+        for item in fragments():
+            shard.append(item.strip())
+            if len(shard) == PUB_SHARD_SIZE:
+                shards.append(publish("pubs", shard))
+                shard = []
+        if shard:
+            shards.append(publish("pubs", shard))
+        written.update(shards)
+        prefix = "../" * page.count("/")
+        attrs[page] = f'data-shards="{" ".join(prefix + p for p in shards)}" data-index="{prefix}{index}"'
+    for name in os.listdir(GEN_DIR):
+        path = f"{GEN_DIR}/{name}"
+        if re.match(r"pubs-(?:index-)?[0-9a-f]{10}\.json$", name) and path not in written:
+            os.remove(path)
+    return attrs
+
+
+# ── Deferred sections (--defer-sections) ──────────────────────────────────
+
+# With --defer-sections the sections below the fold are built with
+# content-visibility: auto, so the browser skips their style, layout and
+# paint until they come near the viewport, and with a contain-intrinsic-size
+# estimated here so the scrollbar and anchor positions are about right.
+# Sections estimated taller than DEFER_INERT_PX also ship their markup in an
+# inert <template data-deferred> that main.js materializes as the section
+# approaches, or before an in-page link jumps past it.
+DEFERRED_SECTIONS = ("research_experience", "honors", "leadership")
+DEFER_INERT_PX = 1600
+DEFER_TEMPLATE = "<template data-deferred>"
+
+# Layout model for the estimates (see style.css): the section's padding and
+# title, then every text block (p, li, h3, ...) as lines wrapped at the
+# container width, with CJK characters counting double
+DEFER_CHROME_PX = 210
+DEFER_BLOCK_PX = 14
+DEFER_LINE_PX = 26
+DEFER_LINE_CHARS = 90
+
+_DEFER_BLOCK_RE = re.compile(r"</?(?:p|li|h3|ul|div)\b[^>]*>")
+_DEFER_HIDDEN_RE = re.compile(r'<(span|p|ul)\b[^>]*\bclass="[^"]*\blang-zh\b[^"]*"[^>]*>.*?</\1>', re.S)
+
+
+def estimate_height(html, lang=None):
+    """Estimated height in px of a fragment of section content. On the
+    bilingual page the English text is measured, as it shows by default."""
+    if not lang:
+        html = _DEFER_HIDDEN_RE.sub("", html)
+    px = 0
+    for block in _DEFER_BLOCK_RE.split(html):
+        text = " ".join(html_mod.unescape(re.sub(r"<[^>]+>", " ", block)).split())
+        if text:
+            width = len(text) + sum(ch >= "\u2e80" for ch in text)
+            px += DEFER_BLOCK_PX + DEFER_LINE_PX * -(-width // DEFER_LINE_CHARS)
+    return px
+
+
+def defer_section(fragments, lang=None):
+    """Spool a section's fragments, measuring them on the way. Returns the
+    fragments again and {"px": the section's estimated height, "inert":
+    whether its markup goes in a <template>}."""
+    est = {"px": DEFER_CHROME_PX}
+
+    def measure():
+        for html in fragments:
+            est["px"] += estimate_height(html, lang)
+            yield html
+
+    replay = spool(measure())
+    est["inert"] = est["px"] > DEFER_INERT_PX
+    return replay(), est
 
 
 # ── Main HTML assembly ────────────────────────────────────────────────────
 
-def build_html(c):
-    affil_en = "<br>".join(c["affiliation"]["en"])
-    affil_zh = "<br>".join(c["affiliation"]["zh"])
+# Output file for each language when pages are generated per language
+LANG_PAGES = {"en": "index.html", "zh": "zh/index.html"}
+
+
+def page_url(c, lang):
+    """URL of a language's page, absolute when content.yaml sets site_url.
+    Relative URLs are written from the site root; fingerprint_assets()
+    re-bases them for pages in subdirectories."""
+    path = LANG_PAGES.get(lang, LANG_PAGES["en"]).rsplit("index.html", 1)[0] or "./"
+    if c.get("site_url"):
+        return c["site_url"].rstrip("/") + "/" + path.lstrip("./")
+    return path
+
+def build_html(c, images=None, cache=None, lang=None, defer=False):
+    """Render the page. With `lang` set, only that language is emitted and
+    the page links its translations via hreflang alternates. With `defer`,
+    the DEFERRED_SECTIONS are rendered for deferred layout."""
+    return "".join(render_page(c, images, cache, lang, defer))
+
+
+def render_page(c, images=None, cache=None, lang=None, defer=False):
+    """build_html() as a stream of fragments: the head, nav and hero first,
+    then each section piece by piece, then the footer. Fragments always
+    start and end next to a block-level tag, so every page stage can work
+    on them one at a time."""
+    s = render_sections(c, images, cache, lang)
+    deferred = {}
+    if defer:
+        for section in DEFERRED_SECTIONS:
+            s[section], deferred[section] = defer_section(s[section], lang)
+    name = {code: _ESCAPED[c["name"][code]] for code in LANGS}
+    affil = {code: "<br>".join(_ESCAPED[part] for part in c["affiliation"][code]) for code in LANGS}
+    heading = {
+        "en": f'{name["en"]} <span class="name-cn">({name["zh"]})</span>',
+        "zh": f'{name["zh"]} <span class="name-cn">({name["en"]})</span>',
+    }
 
     # Compute SHA-256 hash of the password for client-side verification
     password = c.get("password", "")
     pw_hash = hashlib.sha256(password.encode()).hexdigest() if password else ""
 
-    # Cache-busting version string
-    ver = str(int(time.time()))
-
-    return f'''<!DOCTYPE html>
-<html lang="en">
-<head>
-    <meta charset="UTF-8">
-    <meta name="viewport" content="width=device-width, initial-scale=1.0">
-    <title>{c["name"]["en"]} | {c["name"]["zh"]}</title>
-    <meta name="description" content="{c["name"]["en"]} ({c["name"]["zh"]}) — {c["affiliation"]["en"][0]}, {c["affiliation"]["en"][-1]}">
-    <meta name="keywords" content="{c["name"]["en"]}, {c["name"]["zh"]}, {c["affiliation"]["en"][-1]}, computer science, embodied intelligence, robotics">
-    <meta property="og:title" content="{c["name"]["en"]} | {c["affiliation"]["en"][-1]}">
-    <meta property="og:description" content="{c["affiliation"]["en"][0]} at {c["affiliation"]["en"][-1]}">
-    <meta property="og:type" content="website">
-    <link rel="preconnect" href="https://fonts.googleapis.com">
-    <link rel="preconnect" href="https://fonts.gstatic.com" crossorigin>
-    <link href="https://fonts.googleapis.com/css2?family=Inter:wght@400;500;600;700&display=swap" rel="stylesheet">
-    <link rel="stylesheet" href="style.css?v={ver}">
-</head>
-<body>
-    <script>
-    (function(){{var t=localStorage.getItem('theme');if(t==='dark'||(!t&&window.matchMedia('(prefers-color-scheme:dark)').matches))document.body.classList.add('dark');}})();
-    </script>
-
-    <!-- Navigation -->
-    <nav class="navbar" id="navbar">
-        <div class="nav-content">
-            <a href="#about" class="nav-name">
-                <span class="lang-en">{c["name"]["en"]}</span>
-                <span class="lang-zh">{c["name"]["zh"]}</span>
-            </a>
-            <div class="nav-right">
-                <button class="lang-toggle" id="lang-toggle" aria-label="Switch language">
-                    <span class="lang-opt" data-lang="en">EN</span>
-                    <span class="lang-sep">/</span>
-                    <span class="lang-opt" data-lang="zh">中</span>
-                </button>
-                <button class="theme-toggle" id="theme-toggle" aria-label="Toggle dark mode">
-                    <svg class="icon-sun" xmlns="http://www.w3.org/2000/svg" viewBox="0 0 24 24" fill="none" stroke="currentColor" stroke-width="2" stroke-linecap="round" stroke-linejoin="round"><circle cx="12" cy="12" r="5"/><line x1="12" y1="1" x2="12" y2="3"/><line x1="12" y1="21" x2="12" y2="23"/><line x1="4.22" y1="4.22" x2="5.64" y2="5.64"/><line x1="18.36" y1="18.36" x2="19.78" y2="19.78"/><line x1="1" y1="12" x2="3" y2="12"/><line x1="21" y1="12" x2="23" y2="12"/><line x1="4.22" y1="19.78" x2="5.64" y2="18.36"/><line x1="18.36" y1="5.64" x2="19.78" y2="4.22"/></svg>
-                    <svg class="icon-moon" xmlns="http://www.w3.org/2000/svg" viewBox="0 0 24 24" fill="none" stroke="currentColor" stroke-width="2" stroke-linecap="round" stroke-linejoin="round"><path d="M21 12.79A9 9 0 1 1 11.21 3 7 7 0 0 0 21 12.79z"/></svg>
-                </button>
-                <button class="nav-toggle" id="nav-toggle" aria-label="Toggle navigation">
-                    <span></span>
-                    <span></span>
-                    <span></span>
-                </button>
-            </div>
-            <ul class="nav-links" id="nav-links">
-                <li><a href="#about"><span class="lang-en">About</span><span class="lang-zh">关于</span></a></li>
-                <li><a href="#research"><span class="lang-en">Research</span><span class="lang-zh">研究</span></a></li>
-                <li><a href="#publications"><span class="lang-en">Publications</span><span class="lang-zh">论文发表</span></a></li>
-                <li><a href="#resexp"><span class="lang-en">Experience</span><span class="lang-zh">研究经历</span></a></li>
-                <li><a href="#honors"><span class="lang-en">Honors</span><span class="lang-zh">荣誉</span></a></li>
-                <li><a href="#experience"><span class="lang-en">Leadership</span><span class="lang-zh">学生工作</span></a></li>
-            </ul>
-        </div>
-    </nav>
-
-    <!-- Hero / About -->
-    <section class="hero" id="about">
-        <div class="container">
-            <div class="hero-content">
-                <div class="hero-photo">
-                    <img src="assets/profile.jpg" alt="{c["name"]["en"]}" onerror="this.style.display='none'; this.parentElement.classList.add('placeholder-active');">
-                    <div class="photo-placeholder">
-                        <svg viewBox="0 0 120 120" xmlns="http://www.w3.org/2000/svg">
-                            <rect width="120" height="120" fill="#e9ecef"/>
-                            <circle cx="60" cy="45" r="20" fill="#adb5bd"/>
-                            <ellipse cx="60" cy="100" rx="35" ry="25" fill="#adb5bd"/>
-                        </svg>
-                    </div>
-                </div>
-                <div class="hero-text">
-                    <h1>
-                        <span class="lang-en">{c["name"]["en"]} <span class="name-cn">({c["name"]["zh"]})</span></span>
-                        <span class="lang-zh">{c["name"]["zh"]} <span class="name-cn">({c["name"]["en"]})</span></span>
-                    </h1>
-                    <p class="hero-affiliation lang-en">{affil_en}</p>
-                    <p class="hero-affiliation lang-zh">{affil_zh}</p>
-                    <p class="hero-tagline lang-en">{c["tagline"]["en"]}</p>
-                    <p class="hero-tagline lang-zh">{c["tagline"]["zh"]}</p>
-                    <div class="hero-stats">
-{build_stats(c["stats"])}
-                    </div>
-                    <div class="icon-row">
-{build_links(c["links"])}
-                    </div>
-                </div>
-            </div>
-        </div>
-    </section>
-
-    <!-- Research -->
-    <section class="section section-alt" id="research">
-        <div class="container">
-            <h2 class="section-title">
-                <span class="lang-en">Research</span>
-                <span class="lang-zh">研究方向</span>
-            </h2>
-{build_research(c["research"])}
-        </div>
-    </section>
-
-    <!-- Publications -->
-    <section class="section" id="publications">
-        <div class="container">
-            <h2 class="section-title">
-                <span class="lang-en">Publications</span>
-                <span class="lang-zh">论文发表</span>
-            </h2>
-            <div class="pub-list">
-{build_publications(c["publications"])}
-            </div>
-        </div>
-    </section>
-
-    <!-- Research Experience -->
-    <section class="section section-alt" id="resexp">
-        <div class="container">
-            <h2 class="section-title">
-                <span class="lang-en">Research Experience</span>
-                <span class="lang-zh">研究经历</span>
-            </h2>
-            <div class="resexp-list">
-{build_research_experience(c["research_experience"])}
-            </div>
-        </div>
-    </section>
-
-    <!-- Honors & Awards -->
-    <section class="section" id="honors">
-        <div class="container">
-            <h2 class="section-title">
-                <span class="lang-en">Honors &amp; Awards</span>
-                <span class="lang-zh">荣誉与奖项</span>
-            </h2>
-            <ul class="honors-list">
-{build_honors(c["honors"])}
-            </ul>
-        </div>
-    </section>
-
-    <!-- Leadership & Service -->
-    <section class="section section-alt" id="experience">
-        <div class="container">
-            <h2 class="section-title">
-                <span class="lang-en">Leadership &amp; Service</span>
-                <span class="lang-zh">学生工作与社会实践</span>
-            </h2>
-
-{build_leadership(c["leadership"], c["social_practice"])}
-        </div>
-    </section>
-
-    <!-- Footer -->
-    <footer class="footer" id="contact">
-        <div class="container">
-            <p>
-                <span class="lang-en">{c["name"]["en"]}</span>
-                <span class="lang-zh">{c["name"]["zh"]}</span>
-                &middot; {c["email"]}
-            </p>
-            <p class="footer-update">{bi(c["last_updated"])}</p>
-            <p class="footer-visitors">
-                <span class="lang-en">Total visitors: </span>
-                <span class="lang-zh">总访问人数：</span>
-                <span id="busuanzi_value_site_uv"></span>
-            </p>
-        </div>
-    </footer>
-
-    <!-- Password Modal -->
-    <div class="pw-overlay" id="pw-overlay">
-        <div class="pw-modal">
-            <p class="pw-title">
-                <span class="lang-en">This file is password-protected</span>
-                <span class="lang-zh">此文件需要密码访问</span>
-            </p>
-            <input type="password" class="pw-input" id="pw-input"
-                   placeholder="Enter password" autocomplete="off">
-            <p class="pw-error" id="pw-error">
-                <span class="lang-en">Incorrect password</span>
-                <span class="lang-zh">密码错误</span>
-            </p>
-            <div class="pw-actions">
-                <button class="pw-btn pw-cancel" id="pw-cancel">
-                    <span class="lang-en">Cancel</span>
-                    <span class="lang-zh">取消</span>
-                </button>
-                <button class="pw-btn pw-submit" id="pw-submit">
-                    <span class="lang-en">Submit</span>
-                    <span class="lang-zh">确认</span>
-                </button>
-            </div>
-        </div>
-    </div>
-
-    <script>window.__pwHash="{pw_hash}";</script>
-    <script async src="//busuanzi.ibruce.info/busuanzi/2.3/busuanzi.pure.mini.js"></script>
-    <script src="main.js?v={ver}"></script>
-</body>
-</html>
-'''
+    search_label = ""
+    if sharded_pubs(c):
+        search_label = LABELS["pub_search"][lang] if lang else " / ".join(LABELS["pub_search"][code] for code in LANGS)
+
+    photo = picture(
+        c.get("photo", "assets/profile.jpg"), c["name"]["en"], "hero", images,
+        attrs=' onerror="this.style.display=\'none\'; this.closest(\'.hero-photo\').classList.add(\'placeholder-active\');"',
+        indent="                    ",
+    )
+    yield from template("page.html")(c, s, lang, heading, affil, photo, pw_hash, search_label, deferred)
 
 
 # ── --init: generate blank content.yaml ───────────────────────────────────
@@ -411,11 +1724,16 @@ TEMPLATE_YAML = '''\
 # Site Content — Edit this file, then run: python build.py
 # ============================================================
 
+# Public URL of the site, e.g. "https://username.github.io/" (optional)
+site_url: ""
+
 # -- Personal Info --
 name:
   en: "Your Name"
   zh: "你的中文名"
 
+photo: "assets/profile.jpg"     # headshot, resized automatically
+
 affiliation:
   en:
     - "Year & Degree"           # e.g. "3rd Year Undergraduate"
@@ -479,6 +1797,9 @@ research:
     - "段落3：未来方向。"
 
 # -- Publications (content stays in English) --
+# For long lists, render only the first N in the page and load the rest on
+# scroll or search:
+# publications_inline: 20
 publications:
   - title: "Paper Title"
     authors: "Author1*, Author2*, <strong>Your Name</strong>, Advisor"
@@ -530,31 +1851,1192 @@ social_practice:
 
 # -- Footer --
 last_updated: { en: "Last updated: Month Year", zh: "最后更新：XXXX年X月" }
+
+# -- Performance budgets (optional; checked after every build, see --strict-budgets) --
+# budgets:
+#   total_kb: 500              # a page plus everything it loads, as transferred
+#   html_kb: 40                # each page, as transferred
+#   image_kb: 150              # any single image
+#   requests: 25               # requests made while loading a page
+#   third_party_origins: 3     # other hosts contacted while loading a page
 '''
 
 
+# ── Build pipeline ────────────────────────────────────────────────────────
+
+def _parse_yaml(data):
+    """Parse YAML with libyaml's CSafeLoader when PyYAML was built with it.
+    Returns (content, seconds spent importing PyYAML and parsing)."""
+    start = time.perf_counter()
+    try:
+        import yaml
+    except ImportError:
+        print("PyYAML is required. Install it with:  pip install pyyaml")
+        sys.exit(1)
+    content = yaml.load(data, Loader=getattr(yaml, "CSafeLoader", yaml.SafeLoader))
+    return content, time.perf_counter() - start
+
+
+# Parsed content files kept in CACHE_DIR by load_content()
+CONTENT_CACHE_ENTRIES = 4
+
+
+def load_content(path="content.yaml", cache=True):
+    """Parse `path`, reusing the parsed content from the last run when the
+    file is unchanged.
+
+    The cache (a pickle in CACHE_DIR, one per content file, at most
+    CONTENT_CACHE_ENTRIES of the most recently used) is trusted when the
+    file's mtime and size match and otherwise checked against its SHA-256,
+    so touching the file does not force a re-parse. A hit skips importing
+    PyYAML altogether; the time saved is printed.
+    """
+    with open(path, "rb") as f:
+        st = os.fstat(f.fileno())
+        data = f.read()
+    if not cache:
+        return _parse_yaml(data)[0]
+
+    name = hashlib.sha256(os.path.abspath(path).encode()).hexdigest()[:12]
+    cache_path = os.path.join(CACHE_DIR, f"content-{name}.pickle")
+    start = time.perf_counter()
+    try:
+        with open(cache_path, "rb") as f:
+            entry = pickle.load(f)
+    except (OSError, pickle.UnpicklingError, EOFError, AttributeError, ValueError):
+        entry = None
+    digest = None
+    if entry and (entry["mtime_ns"], entry["size"]) != (st.st_mtime_ns, st.st_size):
+        digest = hashlib.sha256(data).hexdigest()
+        if digest != entry["sha256"]:
+            entry = None
+        else:
+            entry.update(mtime_ns=st.st_mtime_ns, size=st.st_size)
+            write_if_changed(cache_path, pickle.dumps(entry, protocol=pickle.HIGHEST_PROTOCOL))
+    if entry:
+        os.utime(cache_path)
+        saved = entry["cost"] - (time.perf_counter() - start)
+        print(f"  {path} unchanged, reused parsed content (saved {saved * 1000:.0f} ms of import + parse)")
+        return entry["content"]
+
+    content, cost = _parse_yaml(data)
+    entry = {"mtime_ns": st.st_mtime_ns, "size": st.st_size, "sha256": digest or hashlib.sha256(data).hexdigest(),
+             "cost": cost, "content": content}
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    write_if_changed(cache_path, pickle.dumps(entry, protocol=pickle.HIGHEST_PROTOCOL))
+    entries = sorted(glob.glob(os.path.join(glob.escape(CACHE_DIR), "content-*.pickle")), key=os.path.getmtime)
+    for stale in entries[:-CONTENT_CACHE_ENTRIES]:
+        os.remove(stale)
+    return content
+
+
+# ── Service worker ────────────────────────────────────────────────────────
+
+SW_PATH = "sw.js"
+
+# Extensions of fingerprinted files installed with the worker; everything
+# else under GEN_DIR (images, PDFs) is cached the first time it is fetched.
+PRECACHE_EXTS = (".css", ".js", ".woff2", ".svg")
+
+SW_TEMPLATE = """// Generated by build.py --service-worker. Do not edit.
+const CACHE = 'site-%(version)s';
+const PRECACHE = %(precache)s;
+const GEN = new URL('%(gen_dir)s/', self.location).pathname;
+
+self.addEventListener('install', e => {
+    e.waitUntil(caches.open(CACHE).then(cache => cache.addAll(PRECACHE)).then(() => self.skipWaiting()));
+});
+
+// A new manifest means a new cache name: drop every older site cache
+self.addEventListener('activate', e => {
+    e.waitUntil(caches.keys().then(keys => Promise.all(
+        keys.filter(key => key.startsWith('site-') && key !== CACHE).map(key => caches.delete(key))
+    )).then(() => self.clients.claim()));
+});
+
+self.addEventListener('fetch', e => {
+    const req = e.request;
+    const url = new URL(req.url);
+    if (req.method !== 'GET' || url.origin !== self.location.origin) return;
+
+    // Pages: stale-while-revalidate, keyed by directory URL
+    if (req.mode === 'navigate') {
+        const key = url.origin + url.pathname.replace(/index\\.html$/, '');
+        e.respondWith(caches.open(CACHE).then(cache => cache.match(key).then(cached => {
+            const fresh = fetch(req).then(res => {
+                if (res.ok) cache.put(key, res.clone());
+                return res;
+            });
+            if (!cached) return fresh;
+            e.waitUntil(fresh.catch(() => {}));
+            return cached;
+        })));
+        return;
+    }
+
+    // Fingerprinted assets never change under the same URL: cache-first
+    if (url.pathname.startsWith(GEN)) {
+        e.respondWith(caches.match(req).then(cached => cached || fetch(req).then(res => {
+            if (res.ok) {
+                const copy = res.clone();
+                caches.open(CACHE).then(cache => cache.put(req, copy));
+            }
+            return res;
+        })));
+    }
+});
+"""
+
+
+def register_service_worker(html, prefix=""):
+    """Point a page fragment at SW_PATH (main.js registers it); pages in
+    subdirectories pass prefix "../"."""
+    return html.replace("window.__pwHash=", f'window.__sw="{prefix}{SW_PATH}";window.__pwHash=', 1)
+
+
+def service_worker(refs, digest):
+    """Render the worker for the pages.
+
+    `refs` maps each page path to the local URLs it references: the
+    precache list holds each page (by directory URL) and the fingerprinted
+    CSS, JS, fonts and sprite they reference. `digest` is a sha256 already
+    fed each page's path and bytes (NUL-terminated, pages in sorted order);
+    the cache name is a hash of that and the list, so any change installs
+    a new worker and retires the old cache.
+    """
+    precache = [os.path.dirname(path) + "/" if "/" in path else "./" for path in refs]
+    for path, urls in refs.items():
+        for url in urls:
+            url = os.path.normpath(os.path.join(os.path.dirname(path), url)).replace(os.sep, "/")
+            if url.startswith(GEN_DIR + "/") and url.endswith(PRECACHE_EXTS):
+                precache.append(url)
+    precache = list(dict.fromkeys(precache))
+    digest.update(json.dumps(precache).encode())
+    return SW_TEMPLATE % {"version": digest.hexdigest()[:12], "precache": json.dumps(precache, indent=4),
+                          "gen_dir": GEN_DIR}
+
+
+# ── Precompressed output ──────────────────────────────────────────────────
+
+COMPRESS_EXTS = (".html", ".css", ".js", ".svg", ".json")
+FILES_MANIFEST = f"{GEN_DIR}/files.json"
+
+
+def _compress_file(path, data, with_br):
+    """Write path.gz (and path.br) at maximum compression; return their sizes.
+    Runs in a worker thread — zlib and brotli release the GIL."""
+    import gzip
+
+    gz = gzip.compress(data, compresslevel=9, mtime=0)
+    write_if_changed(path + ".gz", gz)
+    sizes = {"gz": len(gz)}
+    if with_br:
+        import brotli
+        br = brotli.compress(data, mode=brotli.MODE_TEXT, quality=11)
+        write_if_changed(path + ".br", br)
+        sizes["br"] = len(br)
+    return sizes
+
+
+def compress_outputs(pages):
+    """Write .gz/.br siblings for the pages and every text file in GEN_DIR.
+
+    Files whose content hash matches the previous build (recorded in
+    FILES_MANIFEST, with raw and compressed sizes) are skipped; siblings
+    of outputs that no longer exist are removed. Brotli is used when the
+    brotli package is installed.
+    """
+    try:
+        import brotli  # noqa: F401
+        with_br = True
+    except ImportError:
+        print("brotli not installed — writing .gz only (pip install brotli)")
+        with_br = False
+
+    paths = list(pages)
+    if os.path.isdir(GEN_DIR):
+        paths += sorted(f"{GEN_DIR}/{name}" for name in os.listdir(GEN_DIR)
+                        if name.endswith(COMPRESS_EXTS) and f"{GEN_DIR}/{name}" != FILES_MANIFEST)
+    try:
+        with open(FILES_MANIFEST, "r", encoding="utf-8") as f:
+            previous = json.load(f)
+    except (FileNotFoundError, ValueError):
+        previous = {}
+
+    files, jobs = {}, {}
+    for path in paths:
+        with open(path, "rb") as f:
+            data = f.read()
+        digest = hashlib.sha256(data).hexdigest()[:16]
+        old = previous.get(path)
+        if (old and old["sha256"] == digest and ("br" in old) == with_br
+                and all(os.path.exists(f"{path}.{ext}") for ext in ("gz", "br") if ext in old)):
+            files[path] = old
+            continue
+        files[path] = {"sha256": digest, "raw": len(data)}
+        jobs[path] = data
+    if jobs:
+        from concurrent.futures import ThreadPoolExecutor
+
+        with ThreadPoolExecutor(max_workers=WORKERS) as pool:
+            futures = {path: pool.submit(_compress_file, path, data, with_br) for path, data in jobs.items()}
+            for path, fut in futures.items():
+                files[path].update(fut.result())
+
+    for path in set(previous) - set(files):
+        for ext in ("gz", "br"):
+            if os.path.exists(f"{path}.{ext}"):
+                os.remove(f"{path}.{ext}")
+    if files != previous:
+        os.makedirs(GEN_DIR, exist_ok=True)
+        write_if_changed(FILES_MANIFEST, json.dumps(files, indent=2, sort_keys=True) + "\n")
+    print(f"compressed {len(jobs)}/{len(files)} text outputs")
+    return files
+
+
+# ── Performance budgets ───────────────────────────────────────────────────
+
+# Read when content.yaml has no `budgets:` key
+BUDGETS_FILE = "budgets.yaml"
+
+# Budget key -> what is measured (sizes in KB of 1024 bytes)
+BUDGETS = {
+    "total_kb": "total transfer (KB)",
+    "html_kb": "HTML transfer (KB)",
+    "image_kb": "largest image (KB)",
+    "requests": "requests",
+    "third_party_origins": "third-party origins",
+}
+
+IMAGE_EXTS = (".jpg", ".jpeg", ".png", ".gif", ".webp", ".avif", ".svg")
+
+# Resources a page fetches while loading (not outbound <a> links)
+_LOAD_RE = re.compile(
+    r'<(?:img|script|iframe|source|video|audio|embed)\b[^>]*?\bsrc="([^"]*)"'
+    r'|<link\b(?=[^>]*\brel="(?:stylesheet|preload|modulepreload|icon|manifest)")[^>]*?\bhref="([^"]*)"')
+_CONNECT_RE = re.compile(r'<link\b(?=[^>]*\brel="(?:preconnect|dns-prefetch)")[^>]*?\bhref="([^"]*)"')
+_CSS_URL_RE = re.compile(r"""url\(\s*['"]?([^'")]+)""")
+_ORIGIN_RE = re.compile(r"^(?:[a-z][a-z0-9+.-]*:)?//([^/?#]+)", re.I)
+
+
+class BudgetExceeded(Exception):
+    """Raised by build_site() with --strict-budgets when a page is over budget."""
+
+
+def load_budgets(c):
+    """The `budgets:` of content.yaml, else of BUDGETS_FILE ({} when neither)."""
+    budgets = c.get("budgets")
+    if budgets is None and os.path.isfile(BUDGETS_FILE):
+        with open(BUDGETS_FILE, "rb") as f:
+            budgets = _parse_yaml(f.read())[0]
+    budgets = budgets or {}
+    for key in set(budgets) - set(BUDGETS):
+        print(f"  unknown budget '{key}' ignored (known: {', '.join(BUDGETS)})")
+    return {key: budgets[key] for key in BUDGETS if key in budgets}
+
+
+def _transfer_size(path, sizes):
+    """Bytes sent for `path`: gzip size for text files, raw size otherwise."""
+    if path not in sizes:
+        with open(path, "rb") as f:
+            data = f.read()
+        if path.endswith(COMPRESS_EXTS):
+            import gzip
+
+            data = gzip.compress(data, compresslevel=6, mtime=0)
+        sizes[path] = len(data)
+    return sizes[path]
+
+
+def _resolve(url, base):
+    return os.path.normpath(os.path.join(base, re.split(r"[?#]", url)[0]))
+
+
+def loaded_resources(html, base, sizes):
+    """The resources a browser fetches for `html` (a page or part of one
+    whose relative URLs resolve against `base`): ({local path: transfer
+    size}, {remote URL}). One candidate counts per <img> and preload (its
+    src/href, not every srcset entry), and a <picture> counts the first
+    candidate of its first <source>, the format a current browser picks.
+    Outbound links are not loads, and <noscript> fallbacks are skipped
+    since they duplicate the asynchronously loaded stylesheets. `sizes`
+    caches _transfer_size()."""
+    resolve = functools.partial(_resolve, base=base)
+
+    def first_source(m):
+        srcset = re.search(r'<source\b[^>]*?\bsrcset="\s*([^\s",]+)', m[0])
+        return f'<img src="{srcset[1]}">' if srcset else m[0]
+
+    shown = re.sub(r"<noscript>.*?</noscript>", "", html, flags=re.S | re.I)
+    shown = re.sub(r"<picture\b.*?</picture>", first_source, shown, flags=re.S | re.I)
+    loaded = [url for m in _LOAD_RE.finditer(shown) for url in m.groups() if url]
+    for css in re.findall(r"<style\b[^>]*>(.*?)</style>", shown, re.S | re.I):
+        loaded += _CSS_URL_RE.findall(css)
+    local, remote = {}, set()
+    for url in dict.fromkeys(loaded):
+        if not _is_local(url):
+            remote.add(url)
+        elif os.path.isfile(resolve(url)):
+            path = resolve(url)
+            local[path] = _transfer_size(path, sizes)
+            if path.endswith(".css"):
+                with open(path, "r", encoding="utf-8") as f:
+                    for ref in _CSS_URL_RE.findall(f.read()):
+                        if _is_local(ref) and os.path.isfile(_resolve(ref, os.path.dirname(path))):
+                            ref = _resolve(ref, os.path.dirname(path))
+                            local[ref] = _transfer_size(ref, sizes)
+    return local, remote
+
+
+def measure_page(page, sizes=None):
+    """Transfer sizes, requests and third-party origins of a written page.
+
+    Every local file the page references (thumbnails, link targets,
+    assets) is resolved; the ones it loads (see loaded_resources) count
+    towards the totals, the images towards `images` and those that do not
+    exist are listed in `missing`.
+    """
+    sizes = {} if sizes is None else sizes
+    with open(page, "r", encoding="utf-8") as f:
+        html = f.read()
+    base = os.path.dirname(page)
+    resolve = functools.partial(_resolve, base=base)
+
+    missing = [resolve(url) for url in local_refs(html) if not os.path.exists(resolve(url))]
+    images = {resolve(url): os.path.getsize(resolve(url)) for url in local_refs(html)
+              if url.lower().endswith(IMAGE_EXTS) and os.path.isfile(resolve(url))}
+    local, remote = loaded_resources(html, base, sizes)
+    shown = re.sub(r"<noscript>.*?</noscript>", "", html, flags=re.S | re.I)
+    origins = {m[1].lower() for url in (*remote, *_CONNECT_RE.findall(shown)) if (m := _ORIGIN_RE.match(url))}
+    html_size = _transfer_size(page, sizes)
+    return {
+        "total_kb": (html_size + sum(local.values())) / 1024,
+        "html_kb": html_size / 1024,
+        "image_kb": max(images.values(), default=0) / 1024,
+        "requests": 1 + len(local) + len(remote),
+        "third_party_origins": len(origins),
+        "images": images,
+        "missing": missing,
+    }
+
+
+def check_budgets(pages, budgets):
+    """Measure every written page against `budgets`, print a table per page
+    and return the violations (one line each). Referenced files that do not
+    exist are printed as warnings; they are not violations and add nothing
+    to the totals."""
+    violations, sizes = [], {}
+    for page in pages:
+        m = measure_page(page, sizes)
+        print(f"  budgets for {page}")
+        print(f"  {'budget':<24}{'measured':>10}{'limit':>10}")
+        for key, limit in budgets.items():
+            value = f"{m[key]:,.1f}" if key.endswith("_kb") else f"{m[key]:,}"
+            over = m[key] > limit
+            print(f"  {BUDGETS[key]:<24}{value:>10}{limit:>10,}" + ("  OVER" if over else ""))
+            if over and key != "image_kb":  # listed per image below
+                violations.append(f"{page}: {BUDGETS[key]} {value} > {limit:,}")
+        if "image_kb" in budgets:
+            violations += [f"{page}: image {path} is {size / 1024:,.1f} KB > {budgets['image_kb']:,}"
+                           for path, size in m["images"].items() if size / 1024 > budgets["image_kb"]]
+        for path in m["missing"]:
+            print(f"  warning: {page} references {path}, which does not exist")
+    for line in violations:
+        print(f"  budget exceeded — {line}")
+    return violations
+
+
+# ── Publish directory (--dist) ────────────────────────────────────────────
+
+DIST_MANIFEST = "dist-manifest.json"  # written inside the publish directory
+
+# Published whenever present, though no page links them
+DIST_EXTRA = {"CNAME": "custom domain", ".nojekyll": "GitHub Pages config",
+              "robots.txt": "fetched by crawlers", "favicon.ico": "fetched by browsers"}
+
+_DATA_URLS_RE = re.compile(r'\b(data-shards|data-index)="([^"]*)"')
+_SW_URL_RE = re.compile(r'window\.__sw="([^"]*)"')
+
+
+class DistError(Exception):
+    """Raised by publish_dist() for a directory it did not create."""
+
+
+def _dist_path(url, base):
+    """The file a local URL resolves to from directory `base`; directory
+    URLs resolve to their index.html."""
+    path = os.path.normpath(os.path.join(base, re.split(r"[?#]", url)[0])).replace(os.sep, "/")
+    if url.endswith("/") or os.path.isdir(path):
+        path = os.path.normpath(f"{path}/index.html").replace(os.sep, "/")
+    return path
+
+
+def _file_urls(path, text):
+    """(url, how it is referenced) for each URL in a page, stylesheet or
+    publication shard."""
+    if path.endswith(".css"):
+        return [(url, "css url()") for url in _CSS_URL_RE.findall(text)]
+    if path.endswith(".json"):
+        data = json.loads(text)
+        text = "".join(item for item in data if isinstance(item, str)) if isinstance(data, list) else ""
+    urls = []
+    for attr, value in _URL_ATTR_RE.findall(text):
+        _map_urls(attr, value, lambda url: urls.append((url, attr)))
+    for attr, value in _DATA_URLS_RE.findall(text):
+        urls += [(url, attr) for url in value.split()]
+    urls += [(url, "service worker") for url in _SW_URL_RE.findall(text)]
+    for css in re.findall(r"<style\b[^>]*>(.*?)</style>", text, re.S | re.I):
+        urls += [(url, "css url()") for url in _CSS_URL_RE.findall(css)]
+    return urls
+
+
+def reachable(pages):
+    """{path: [why, ...]} for the pages and every local file reachable from
+    them through HTML attributes, inline and linked CSS, the service worker
+    and the HTML inside publication shards (whose URLs are relative to the
+    page that loads them)."""
+    found = {page: ["page"] for page in pages}
+    todo = [(page, os.path.dirname(page)) for page in pages]
+    seen = set(todo)
+    while todo:
+        path, base = todo.pop()
+        if not path.endswith((".html", ".css", ".json")):
+            continue
+        with open(path, "r", encoding="utf-8") as f:
+            text = f.read()
+        for url, how in _file_urls(path, text):
+            if not _is_local(url):
+                continue
+            target = _dist_path(url, base)
+            if not os.path.isfile(target):
+                continue
+            found.setdefault(target, []).append(f"{path} {how}")
+            child = (target, base if target.endswith(".json") else os.path.dirname(target))
+            if child not in seen:
+                seen.add(child)
+                todo.append(child)
+    return {path: list(dict.fromkeys(why)) for path, why in found.items()}
+
+
+def publish_dist(pages, dist, compressed=False):
+    """Mirror the files reachable from `pages` (see reachable) into `dist`.
+
+    Files are hardlinked from the build output (copied where linking is not
+    possible) and left alone when `dist` already holds the same bytes.
+    With `compressed`, the .gz/.br siblings written by --compress go along.
+    DIST_MANIFEST in `dist` records each file's size, hash and why it was
+    included; files the previous manifest lists that are no longer
+    published are removed, and nothing else in `dist` is touched. Raises
+    DistError if `dist` is a non-empty directory without a manifest, i.e.
+    one this function did not create.
+    """
+    import filecmp
+
+    manifest_path = os.path.join(dist, DIST_MANIFEST)
+    try:
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            previous = json.load(f)
+    except FileNotFoundError:
+        if os.path.isdir(dist) and os.listdir(dist):
+            raise DistError(f"{dist}/ is not empty and has no {DIST_MANIFEST}; refusing to publish into it")
+        previous = {}
+    except ValueError:
+        raise DistError(f"{manifest_path} is not valid JSON; refusing to publish into {dist}/")
+
+    files = reachable(pages)
+    for name, why in DIST_EXTRA.items():
+        if os.path.isfile(name):
+            files[name] = [why]
+    if compressed:
+        for path in list(files):
+            for ext in ("gz", "br"):
+                if os.path.isfile(f"{path}.{ext}"):
+                    files[f"{path}.{ext}"] = [f"precompressed {path}"]
+
+    counts = dict.fromkeys(("linked", "copied", "unchanged", "removed"), 0)
+    for path in sorted(files):
+        target = os.path.join(dist, path)
+        if os.path.isfile(target) and (os.path.samefile(path, target) or filecmp.cmp(path, target, shallow=False)):
+            counts["unchanged"] += 1
+            continue
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        tmp = os.path.join(os.path.dirname(target), f".tmp-{os.path.basename(target)}")
+        if os.path.lexists(tmp):
+            os.remove(tmp)
+        try:
+            os.link(path, tmp)
+            counts["linked"] += 1
+        except OSError:
+            shutil.copy2(path, tmp)
+            counts["copied"] += 1
+        os.replace(tmp, target)
+
+    for path in sorted(set(previous) - set(files)):
+        if os.path.isabs(path) or os.path.normpath(path).split(os.sep)[0] == "..":
+            continue  # never outside `dist`, whatever the manifest says
+        target = os.path.join(dist, path)
+        if os.path.isfile(target):
+            os.remove(target)
+            counts["removed"] += 1
+        parent = os.path.dirname(target)
+        while os.path.normpath(parent) != os.path.normpath(dist) and os.path.isdir(parent) and not os.listdir(parent):
+            os.rmdir(parent)
+            parent = os.path.dirname(parent)
+
+    manifest = {path: {"bytes": os.path.getsize(path), "sha256": _file_digest(path), "why": why}
+                for path, why in sorted(files.items())}
+    write_if_changed(manifest_path, json.dumps(manifest, indent=2, ensure_ascii=False) + "\n")
+    total = sum(entry["bytes"] for entry in manifest.values())
+    print(f"{dist}/: {len(files)} files, {total:,} bytes ({', '.join(f'{n} {k}' for k, n in counts.items())})")
+    return manifest
+
+
+# ── Build profile ─────────────────────────────────────────────────────────
+
+PROFILE_PATH = "build-profile.json"
+
+# Wall time per stage (seconds), accumulated by timed() over the process
+STAGE_TIMES = {}
+
+# Top-level regions of a page that bytes and asset weights are attributed to
+_REGION_RE = re.compile(
+    r'<head>.*?</head>|<(nav)\b.*?</nav>|<section\b[^>]*\bid="([^"]+)".*?</section>|<(footer)\b.*?</footer>', re.S)
+
+
+@contextlib.contextmanager
+def timed(stage):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_TIMES[stage] = STAGE_TIMES.get(stage, 0.0) + time.perf_counter() - start
+
+
+def timed_iter(stage, fragments):
+    """Yield from `fragments`, charging the time spent producing each one
+    to `stage` (for generators that run while a page is streamed)."""
+    it, spent, clock = iter(fragments), 0.0, time.perf_counter
+    try:
+        while True:
+            start = clock()
+            fragment = next(it, None)
+            spent += clock() - start
+            if fragment is None:
+                return
+            yield fragment
+    finally:
+        STAGE_TIMES[stage] = STAGE_TIMES.get(stage, 0.0) + spent
+
+
+def page_regions(html):
+    """{region: html} for the head, nav, each section (by id) and footer;
+    whatever is left over (mostly body-end scripts) goes to "other"."""
+    regions, rest, pos = {}, [], 0
+    for m in _REGION_RE.finditer(html):
+        name = m[1] or m[2] or m[3] or "head"
+        regions[name] = regions.get(name, "") + m[0]
+        rest.append(html[pos:m.start()])
+        pos = m.end()
+    regions["other"] = "".join(rest) + html[pos:]
+    return regions
+
+
+def profile_report(pages):
+    """Stage timings plus, per written page and region, the HTML bytes, the
+    transfer size of the local files the region loads (as measure_page
+    counts them; a file loaded from several regions counts in one of them,
+    in the region showing it rather than the head that preloads it)
+    and the size of those it only links to (PDFs, other srcset
+    candidates, ...)."""
+    report = {"timings": {stage: round(sec, 6) for stage, sec in STAGE_TIMES.items()}, "pages": {}}
+    sizes = {}
+    for page in pages:
+        with open(page, "r", encoding="utf-8") as f:
+            html = f.read()
+        base = os.path.dirname(page)
+        regions, counted = {}, set()
+        parts = page_regions(html)
+        for name, text in sorted(parts.items(), key=lambda kv: kv[0] == "head"):
+            loads = loaded_resources(text, base, sizes)[0]
+            assets = {path: size for path, size in loads.items() if path not in counted}
+            counted.update(loads)
+            linked = {}
+            for url in local_refs(text):
+                path = _resolve(url, base)
+                if path not in loads and os.path.isfile(path):
+                    linked[path] = os.path.getsize(path)
+            regions[name] = {"bytes": len(text.encode()), "asset_bytes": sum(assets.values()), "assets": assets,
+                             "linked_bytes": sum(linked.values()), "linked": linked}
+        report["pages"][page] = {"bytes": len(html.encode()), "regions": {name: regions[name] for name in parts}}
+    return report
+
+
+def print_profile(report):
+    timings = sorted(report["timings"].items(), key=lambda kv: -kv[1])
+    print(f"  {'stage':<32}{'ms':>10}")
+    for stage, sec in timings:
+        print(f"  {stage:<32}{sec * 1000:>10.2f}")
+    for page, info in report["pages"].items():
+        print(f"\n  {page} ({info['bytes']:,} bytes)")
+        print(f"  {'region':<20}{'html bytes':>12}{'share':>8}{'loads':>7}{'loaded bytes':>14}{'linked bytes':>14}")
+        for name, r in sorted(info["regions"].items(), key=lambda kv: -(kv[1]["bytes"] + kv[1]["asset_bytes"])):
+            share = r["bytes"] / info["bytes"] if info["bytes"] else 0
+            print(f"  {name:<20}{r['bytes']:>12,}{share:>8.1%}{len(r['assets']):>7}{r['asset_bytes']:>14,}"
+                  f"{r['linked_bytes']:>14,}")
+
+
+def build_site(content, opts=None, cache=None):
+    """Run every stage for `content` and write the page(s).
+
+    `opts` is the parsed command line (see parse_args). Returns
+    (written, manifest): whether any page changed on disk, and the
+    fingerprint manifest mapping source paths to their hashed copies.
+    Raises BudgetExceeded with --strict-budgets when a page is over the
+    budgets of load_budgets() (the pages are written all the same).
+
+    Pages are never held in memory whole: each is rendered as a stream of
+    fragments (see render_page) into a spool, and every page stage reads
+    one spool and writes the next, fragment by fragment.
+    """
+    opts = opts or parse_args([])
+    with timed("images"):
+        images = process_images(collect_images(content))
+    langs = {LANG_PAGES[code]: code for code in LANGS} if opts.split_lang else {"index.html": None}
+    pages = {}
+    with timed("build_html"):
+        for path, lang in langs.items():
+            pages[path] = spool(render_page(content, images, cache, lang, opts.defer_sections))
+            if sharded_pubs(content):
+                pages[path + PUB_ITEMS] = spool(pub_items(content, images, lang), size=0)
+
+    def stage(fn, *args, rebase=False):
+        """Map fn over every fragment of every page into fresh spools."""
+        return {path: spool((fn(html, *args, *(("../" * path.count("/"),) if rebase else ()))
+                             for html in replay()), size=0 if path.endswith(PUB_ITEMS) else 1 << 16)
+                for path, replay in pages.items()}
+
+    with timed("fonts"):
+        faces = process_fonts(page_codepoints(fragments(pages)), content.get("fonts", FONT_FILES))
+        if faces:
+            pages = stage(apply_fonts, faces, rebase=True)
+
+    with timed("bundle_js"):
+        with open("main.js", "r", encoding="utf-8") as f:
+            source = f.read()
+        js, dropped = bundle_js(source, js_features(content, opts, pages))
+        overrides = {"main.js": minify_js(js).encode()}
+        if dropped:
+            print(f"  main.js bundle without: {', '.join(dropped)}")
+    report = [("main.js", len(source.encode()), len(overrides["main.js"]))]
+    if opts.optimize:
+        with timed("optimize"):
+            css, rows = optimize_assets(fragments(pages), js)
+            overrides.update(css)
+            report = rows + report
+    with timed("icons"):
+        names = icon_names(fragments(pages))
+        if names:
+            sprite = icon_sprite(names)
+            pages = stage(apply_icon_sprite, sprite, opts.icon_sprite)
+            if opts.icon_sprite == "external":
+                overrides[SPRITE_FILE] = sprite.encode()
+    if opts.critical_css:
+        if "style.css" in overrides:
+            css = overrides["style.css"].decode()
+        else:
+            with open("style.css", "r", encoding="utf-8") as f:
+                css = f.read()
+        with timed("critical_css"):
+            pages = stage(apply_critical_path, css, hero_preload(content, images))
+    with timed("fingerprint"):
+        manifest = fingerprint_assets(dict.fromkeys(ref for html in fragments(pages) for ref in local_refs(html)),
+                                      overrides)
+        pages = stage(rewrite_urls, manifest, rebase=True)
+    if opts.optimize:
+        with timed("minify_html"):
+            before = {path: sum(len(html.encode()) for html in replay()) for path, replay in pages.items()}
+            pages = stage(minify_fragment)
+            for path, replay in pages.items():
+                if not path.endswith(PUB_ITEMS):
+                    # +1 for the trailing newline added when the page is written
+                    report.append((path, before[path], sum(len(html.encode()) for html in replay()) + 1))
+        print_size_report(report)
+    with timed("pub_shards"):
+        attrs = write_pub_shards(content, pages)
+        if attrs:
+            pages = {path: spool(html.replace('data-shards="" data-index=""', attrs[path], 1) for html in replay())
+                     for path, replay in pages.items()}
+
+    refs = None
+    if opts.service_worker and not opts.watch:
+        with timed("service_worker"):
+            pages = stage(register_service_worker, rebase=True)
+            refs = {path: list(dict.fromkeys(ref for html in replay() for ref in local_refs(html)))
+                    for path, replay in pages.items()}
+
+    written, digest = False, hashlib.sha256()
+    with timed("write"):
+        for path in sorted(pages):
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            page = pages[path]()
+            if opts.optimize:
+                page = itertools.chain(page, ["\n"])
+            if refs is None:
+                written |= write_stream(path, page)
+                continue
+            digest.update(path.encode() + b"\0")
+            written |= write_stream(path, page, digest)
+            digest.update(b"\0")
+        if refs is not None:
+            written |= write_if_changed(SW_PATH, service_worker(refs, digest))
+    outputs = [*pages, SW_PATH] if refs is not None else list(pages)
+    if opts.compress:
+        with timed("compress"):
+            compress_outputs(outputs)
+    if opts.dist and not opts.watch:
+        with timed("dist"):
+            publish_dist(list(pages), opts.dist, opts.compress)
+    budgets = load_budgets(content)
+    if budgets:
+        with timed("budgets"):
+            violations = check_budgets(pages, budgets)
+        if violations and opts.strict_budgets and not opts.watch:
+            raise BudgetExceeded(f"{len(violations)} budget violation(s)")
+    if opts.profile:
+        report = profile_report(pages)
+        print_profile(report)
+        write_if_changed(PROFILE_PATH, json.dumps(report, indent=2) + "\n")
+        print(f"Wrote {PROFILE_PATH}")
+    return written, manifest
+
+
+# ── Watch mode / dev server ───────────────────────────────────────────────
+
+WATCH_FILES = ("content.yaml", "style.css", "main.js")
+WATCH_DIRS = ("assets", "templates")
+DEBOUNCE = 0.05  # seconds of quiet after the last event before rebuilding
+
+LIVERELOAD_SCRIPT = """<script>
+(function(){
+    var es = new EventSource('/__livereload');
+    function ack(id){
+        requestAnimationFrame(function(){ requestAnimationFrame(function(){
+            fetch('/__livereload/ack?id=' + id, {method: 'POST'});
+        }); });
+    }
+    es.addEventListener('css', function(e){
+        var d = JSON.parse(e.data);
+        var old = document.querySelector('link[href$="' + d.old + '"]');
+        if (!old) { sessionStorage.setItem('__lr', d.id); location.reload(); return; }
+        var link = old.cloneNode();
+        link.href = old.getAttribute('href').replace(d.old, d.href);
+        link.onload = function(){ old.remove(); ack(d.id); };
+        old.after(link);
+    });
+    es.addEventListener('reload', function(e){
+        sessionStorage.setItem('__lr', JSON.parse(e.data).id);
+        location.reload();
+    });
+    var pending = sessionStorage.getItem('__lr');
+    if (pending) {
+        sessionStorage.removeItem('__lr');
+        window.addEventListener('load', function(){ ack(pending); });
+    }
+})();
+</script>
+"""
+
+
+def _is_watched(path):
+    path = os.path.normpath(path)
+    if path in WATCH_FILES:
+        return True
+    name = os.path.basename(path)
+    return (any(path.startswith(d + os.sep) for d in WATCH_DIRS)
+            and not path.startswith(os.path.normpath(GEN_DIR) + os.sep)
+            and not name.startswith("."))
+
+
+def _watched_dirs():
+    dirs = ["."]
+    for top in WATCH_DIRS:
+        for root, subdirs, _ in os.walk(top):
+            subdirs[:] = [d for d in subdirs if os.path.join(root, d) != os.path.normpath(GEN_DIR)]
+            dirs.append(root)
+    return dirs
+
+
+def _inotify_changes(timeout=DEBOUNCE / 2):
+    """Changed-path sets from inotify (Linux). Raises OSError if unavailable.
+
+    Directories are watched rather than files so that editors that save by
+    renaming a temporary file over the original are still picked up.
+    """
+    import ctypes, ctypes.util, select, struct
+
+    libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+    fd = libc.inotify_init1(os.O_CLOEXEC)
+    if fd < 0:
+        raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+    mask = 0x2 | 0x8 | 0x40 | 0x80 | 0x100 | 0x200  # MODIFY CLOSE_WRITE MOVED_FROM MOVED_TO CREATE DELETE
+    wds = {}
+    for d in _watched_dirs():
+        wd = libc.inotify_add_watch(fd, d.encode(), mask)
+        if wd < 0:
+            os.close(fd)
+            raise OSError(ctypes.get_errno(), f"cannot watch {d}")
+        wds[wd] = d
+
+    def events():
+        while True:
+            changed = set()
+            if select.select([fd], [], [], timeout)[0]:
+                buf = os.read(fd, 64 * 1024)
+                i = 0
+                while i < len(buf):
+                    wd, _, _, length = struct.unpack_from("iIII", buf, i)
+                    name = buf[i + 16:i + 16 + length].rstrip(b"\0").decode(errors="replace")
+                    i += 16 + length
+                    path = os.path.normpath(os.path.join(wds.get(wd, "."), name))
+                    if _is_watched(path):
+                        changed.add(path)
+            yield changed
+    return events()
+
+
+def _poll_changes(interval=0.1):
+    """Changed-path sets from comparing (mtime, size) snapshots."""
+    def snapshot():
+        snap = {}
+        paths = list(WATCH_FILES)
+        for d in _watched_dirs()[1:]:
+            paths += [os.path.join(d, n) for n in os.listdir(d)]
+        for path in paths:
+            if _is_watched(path):
+                try:
+                    st = os.stat(path)
+                    snap[os.path.normpath(path)] = (st.st_mtime_ns, st.st_size)
+                except OSError:
+                    pass
+        return snap
+
+    prev = snapshot()
+    while True:
+        time.sleep(interval)
+        cur = snapshot()
+        yield {p for p in prev.keys() | cur.keys() if prev.get(p) != cur.get(p)}
+        prev = cur
+
+
+def watch_changes():
+    """Yield debounced sets of changed source paths, forever."""
+    try:
+        events = _inotify_changes()
+        print("Watching for changes (inotify)")
+    except (OSError, AttributeError):
+        events = _poll_changes()
+        print("Watching for changes (polling)")
+    pending, last = set(), 0.0
+    for changed in events:
+        now = time.monotonic()
+        if changed:
+            pending |= changed
+            last = now
+        elif pending and now - last >= DEBOUNCE:
+            yield pending
+            pending = set()
+
+
+def livereload_handler():
+    """The dev server's request handler class (defined on first use, so that
+    http.server is only imported by --watch)."""
+    from http.server import SimpleHTTPRequestHandler
+
+    class LiveReloadHandler(SimpleHTTPRequestHandler):
+        """Static file handler that injects the live-reload client into HTML
+        pages and serves the /__livereload event stream."""
+
+        clients = []        # one queue.Queue per connected EventSource
+        saved_at = {}       # reload id -> wall-clock time the triggering file was saved
+
+        def end_headers(self):
+            self.send_header("Cache-Control", "no-store")
+            super().end_headers()
+
+        def do_GET(self):
+            path = self.path.split("?", 1)[0]
+            if path == "/__livereload":
+                return self._event_stream()
+            if path.endswith("/") or path.endswith(".html"):
+                return self._html_with_client(path)
+            return super().do_GET()
+
+        def do_POST(self):
+            if self.path.startswith("/__livereload/ack"):
+                reload_id = self.path.rsplit("=", 1)[-1]
+                saved = self.saved_at.pop(reload_id, None)
+                if saved is not None:
+                    print(f"  save → repaint: {(time.time() - saved) * 1000:.0f} ms")
+                self.send_response(204)
+                self.end_headers()
+            else:
+                self.send_error(404)
+
+        def _html_with_client(self, path):
+            file = self.translate_path(path + "index.html" if path.endswith("/") else path)
+            try:
+                with open(file, "rb") as f:
+                    body = f.read()
+            except OSError:
+                return self.send_error(404)
+            body = body.replace(b"</body>", LIVERELOAD_SCRIPT.encode() + b"</body>", 1)
+            self.send_response(200)
+            self.send_header("Content-Type", "text/html; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _event_stream(self):
+            q = queue.Queue()
+            self.clients.append(q)
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.end_headers()
+            try:
+                while True:
+                    try:
+                        event, data = q.get(timeout=15)
+                        self.wfile.write(f"event: {event}\ndata: {json.dumps(data)}\n\n".encode())
+                    except queue.Empty:
+                        self.wfile.write(b": ping\n\n")
+                    self.wfile.flush()
+            except (BrokenPipeError, ConnectionResetError):
+                pass
+            finally:
+                self.clients.remove(q)
+
+        @classmethod
+        def broadcast(cls, event, data, saved_at):
+            cls.saved_at[str(data["id"])] = saved_at
+            for q in list(cls.clients):
+                q.put((event, data))
+
+        def log_message(self, format, *args):
+            pass
+
+    return LiveReloadHandler
+
+
+def watch(content, opts):
+    """Serve the site on localhost and rebuild + live-reload on every save."""
+    port = opts.port
+    cache = load_fragment_cache()
+    _, manifest = build_site(content, opts, cache)
+    from functools import partial
+    from http.server import ThreadingHTTPServer
+
+    handler = livereload_handler()
+    server = ThreadingHTTPServer(("127.0.0.1", port), partial(handler, directory="."))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    print(f"Serving on http://127.0.0.1:{port}/  (Ctrl+C to stop)")
+
+    reload_id = 0
+    try:
+        for changed in watch_changes():
+            saved_at = max((os.stat(p).st_mtime for p in changed if os.path.exists(p)), default=time.time())
+            start = time.perf_counter()
+            try:
+                if "content.yaml" in changed:
+                    content = load_content()
+                old_manifest = manifest
+                _, manifest = build_site(content, opts, cache)
+            except Exception as e:
+                print(f"  build failed: {e}")
+                continue
+            reload_id += 1
+            print(f"Rebuilt in {(time.perf_counter() - start) * 1000:.0f} ms ({', '.join(sorted(changed))})")
+            if changed == {"style.css"} and "style.css" in old_manifest:
+                handler.broadcast(
+                    "css", {"id": reload_id, "old": old_manifest["style.css"], "href": manifest["style.css"]}, saved_at)
+            else:
+                handler.broadcast("reload", {"id": reload_id}, saved_at)
+    except KeyboardInterrupt:
+        print()
+    finally:
+        server.shutdown()
+        save_fragment_cache(cache)
+
+
+# ── Batch builds ──────────────────────────────────────────────────────────
+
+def batch_sites(specs):
+    """Expand batch arguments into (content path, site dir) pairs.
+
+    Each spec is a content file or glob, optionally followed by =DIR. The
+    site is built in DIR (which holds its style.css, main.js and assets/),
+    by default the directory of the content file. When a glob with =DIR
+    matches several files, each site goes to DIR/<name of its directory>.
+    """
+    sites = []
+    for spec in specs:
+        pattern, _, out_dir = spec.partition("=")
+        matches = sorted(glob.glob(pattern)) or [pattern]
+        for path in matches:
+            site = os.path.dirname(path) or "."
+            if out_dir:
+                site = os.path.join(out_dir, os.path.basename(os.path.abspath(site))) if len(matches) > 1 else out_dir
+            sites.append((os.path.abspath(path), os.path.abspath(site)))
+    return list(dict.fromkeys(sites))
+
+
+def _build_one(content_path, site_dir, opts, shared_cache, workers):
+    """Build one site of a batch. Runs in a worker process.
+
+    Returns (status, seconds, detail); exceptions are reported rather than
+    raised so that one broken site does not stop the batch.
+    """
+    global SHARED_CACHE, WORKERS
+    SHARED_CACHE, WORKERS = shared_cache, workers
+    STAGE_TIMES.clear()
+    start, cwd, log = time.perf_counter(), os.getcwd(), io.StringIO()
+    try:
+        os.chdir(site_dir)
+        with contextlib.redirect_stdout(log):
+            content = load_content(content_path)
+            cache = load_fragment_cache() if opts.incremental else None
+            written, _ = build_site(content, opts, cache)
+            if cache is not None:
+                save_fragment_cache(cache)
+        return ("built" if written else "up to date"), time.perf_counter() - start, ""
+    except Exception as e:
+        return "FAILED", time.perf_counter() - start, f"{type(e).__name__}: {e}".splitlines()[0]
+    finally:
+        os.chdir(cwd)
+
+
+def batch(specs, opts):
+    """Build many sites in parallel; returns the number that failed."""
+    sites = batch_sites(specs)
+    if not sites:
+        print("No content files matched.")
+        return 0
+    jobs = min(len(sites), opts.jobs or WORKERS)
+    shared = os.path.abspath(os.path.join(CACHE_DIR, "shared"))
+    print(f"Building {len(sites)} site(s) with {jobs} worker(s)")
+
+    start, results = time.perf_counter(), {}
+    from concurrent.futures import ProcessPoolExecutor, as_completed
+
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        futures = {pool.submit(_build_one, path, site, opts, shared, max(1, WORKERS // jobs)): (path, site)
+                   for path, site in sites}
+        for fut in as_completed(futures):
+            path, site = futures[fut]
+            try:
+                results[path] = fut.result()
+            except Exception as e:  # worker process died
+                results[path] = ("FAILED", 0.0, f"{type(e).__name__}: {e}")
+            status, sec, detail = results[path]
+            print(f"  {status:<11}{sec:>7.2f}s  {os.path.relpath(path)}" + (f"  — {detail}" if detail else ""))
+
+    failed = sum(1 for status, _, _ in results.values() if status == "FAILED")
+    print(f"{len(sites) - failed}/{len(sites)} sites built in {time.perf_counter() - start:.2f}s"
+          + (f", {failed} failed" if failed else ""))
+    return failed
+
+
 # ── Main ──────────────────────────────────────────────────────────────────
 
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Generate index.html from content.yaml.")
+    parser.add_argument("--init", action="store_true", help="generate a blank content.yaml template")
+    parser.add_argument("--incremental", action="store_true",
+                        help="re-render only the sections whose content changed since the last build")
+    parser.add_argument("--watch", action="store_true",
+                        help="rebuild on change and serve the site with live reload")
+    parser.add_argument("--port", type=int, default=8000, help="dev server port for --watch (default 8000)")
+    parser.add_argument("--optimize", action="store_true",
+                        help="minify HTML/CSS and drop CSS selectors the pages never use")
+    parser.add_argument("--no-critical-css", dest="critical_css", action="store_false",
+                        help="do not inline above-the-fold CSS, load stylesheets asynchronously "
+                             "or preload the hero image")
+    parser.add_argument("--split-lang", action="store_true",
+                        help="write one page per language (index.html, zh/index.html) instead of "
+                             "a single bilingual page")
+    parser.add_argument("--compress", action="store_true",
+                        help="write .gz and .br siblings of every text output plus a size manifest")
+    parser.add_argument("--service-worker", action="store_true",
+                        help=f"generate {SW_PATH} with a precache manifest for instant repeat visits")
+    parser.add_argument("--defer-sections", action="store_true",
+                        help="skip layout of the sections below the fold until they near the viewport, "
+                             "and ship long ones as <template> markup materialized by main.js")
+    parser.add_argument("--icon-sprite", choices=("inline", "external"), default="inline",
+                        help="embed the SVG icon sprite in each page (default) or link a cacheable "
+                             f"{SPRITE_FILE}")
+    parser.add_argument("--dist", nargs="?", const="dist", metavar="DIR",
+                        help="also publish only the files the pages reference to DIR (default dist/), "
+                             f"listed with the reason in DIR/{DIST_MANIFEST}")
+    parser.add_argument("--strict-budgets", action="store_true",
+                        help=f"exit with status 1 when a page exceeds the budgets in content.yaml "
+                             f"(or {BUDGETS_FILE})")
+    parser.add_argument("--batch", nargs="+", metavar="CONTENT[=DIR]",
+                        help="build many sites in parallel from content files or globs, each in its "
+                             "own directory (default: the content file's directory)")
+    parser.add_argument("--jobs", type=int, help="parallel sites for --batch (default: CPU count)")
+    parser.add_argument("--profile", action="store_true",
+                        help=f"print per-stage timings and per-section bytes/asset weights; "
+                             f"write them to {PROFILE_PATH}")
+    parser.add_argument("--cprofile", metavar="FILE",
+                        help="dump cProfile stats for the whole run to FILE (read with pstats)")
+    return parser.parse_args(argv)
+
+
 def main():
-    if "--init" in sys.argv:
+    args = parse_args()
+    if args.init:
         with open("content.yaml", "w", encoding="utf-8") as f:
             f.write(TEMPLATE_YAML)
         print("Created blank content.yaml — fill it in, then run: python build.py")
         return
 
+    if args.batch:
+        sys.exit(1 if batch(args.batch, args) else 0)
+
+    if args.cprofile:
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
+
     try:
-        with open("content.yaml", "r", encoding="utf-8") as f:
-            content = yaml.safe_load(f)
+        with timed("yaml"):
+            content = load_content()
     except FileNotFoundError:
         print("content.yaml not found. Run 'python build.py --init' to generate a template.")
         sys.exit(1)
 
-    html = build_html(content)
-
-    with open("index.html", "w", encoding="utf-8") as f:
-        f.write(html)
+    if args.watch:
+        watch(content, args)
+        return
 
-    print("Built index.html from content.yaml")
+    cache = load_fragment_cache() if args.incremental else None
+    try:
+        written, _ = build_site(content, args, cache)
+    except (BudgetExceeded, DistError) as e:
+        print(f"Build failed: {e}")
+        sys.exit(1)
+    if cache is not None:
+        save_fragment_cache(cache)
+
+    outputs = ", ".join(LANG_PAGES.values()) if args.split_lang else "index.html"
+    if written:
+        print(f"Built {outputs} from content.yaml")
+    else:
+        print(f"{outputs} up to date")
+    if args.cprofile:
+        profiler.disable()
+        profiler.dump_stats(args.cprofile)
+        print(f"Wrote cProfile stats to {args.cprofile}")
 
 
 if __name__ == "__main__":
@@ -1,3 +1,7 @@
+// Features are delimited by "// @feature <name>" lines; build.py drops the
+// ones a site does not use from the bundle it publishes. Code before the
+// first marker is always included.
+
 // Sticky nav shadow on scroll
 const navbar = document.getElementById('navbar');
 window.addEventListener('scroll', () => {
@@ -43,10 +47,32 @@ const observer = new IntersectionObserver((entries) => {
 
 sections.forEach(section => observer.observe(section));
 
+// @feature lang
 // Language toggle
 const langToggle = document.getElementById('lang-toggle');
 const langOpts = langToggle.querySelectorAll('.lang-opt');
 
+// Per-language builds (build.py --split-lang) link each translation as an
+// hreflang alternate; the toggle then navigates instead of swapping classes.
+const langPages = {};
+document.querySelectorAll('link[rel="alternate"][hreflang]').forEach(link => {
+    langPages[link.hreflang] = link.href;
+});
+
+// @feature lang-pages
+if (langPages.en && langPages.zh) {
+    const pageLang = document.documentElement.lang;
+    langOpts.forEach(opt => {
+        opt.classList.toggle('active', opt.dataset.lang === pageLang);
+    });
+    langToggle.addEventListener('click', () => {
+        const next = pageLang === 'zh' ? 'en' : 'zh';
+        localStorage.setItem('lang', next);
+        window.location.href = langPages[next] + window.location.hash;
+    });
+}
+
+// @feature lang-inline
 function setLang(lang) {
     document.body.classList.toggle('zh', lang === 'zh');
     document.documentElement.lang = lang;
@@ -56,22 +82,25 @@ function setLang(lang) {
     localStorage.setItem('lang', lang);
 }
 
-// Restore saved language preference
-const savedLang = localStorage.getItem('lang');
-if (savedLang) {
-    setLang(savedLang);
-} else {
-    // Default to English, mark EN as active
-    langOpts.forEach(opt => {
-        opt.classList.toggle('active', opt.dataset.lang === 'en');
+if (!(langPages.en && langPages.zh)) {
+    // Restore saved language preference
+    const savedLang = localStorage.getItem('lang');
+    if (savedLang) {
+        setLang(savedLang);
+    } else {
+        // Default to English, mark EN as active
+        langOpts.forEach(opt => {
+            opt.classList.toggle('active', opt.dataset.lang === 'en');
+        });
+    }
+
+    langToggle.addEventListener('click', () => {
+        const isZh = document.body.classList.contains('zh');
+        setLang(isZh ? 'en' : 'zh');
     });
 }
 
-langToggle.addEventListener('click', () => {
-    const isZh = document.body.classList.contains('zh');
-    setLang(isZh ? 'en' : 'zh');
-});
-
+// @feature theme
 // Dark mode toggle
 const themeToggle = document.getElementById('theme-toggle');
 
@@ -92,6 +121,7 @@ themeToggle.addEventListener('click', () => {
     setTheme(!document.body.classList.contains('dark'));
 });
 
+// @feature password
 // Password protection for sensitive links
 (() => {
     const overlay = document.getElementById('pw-overlay');
@@ -148,3 +178,137 @@ themeToggle.addEventListener('click', () => {
     input.addEventListener('keydown', e => { if (e.key === 'Enter') submit(); });
     overlay.addEventListener('click', e => { if (e.target === overlay) closeModal(); });
 })();
+
+// @feature pubs
+// Sharded publication list (content.yaml publications_inline): the first
+// entries are in the page, the rest load from JSON shards on scroll or search
+(function () {
+    const list = document.querySelector('.pub-list[data-shards]');
+    if (!list) return;
+    const inline = +list.dataset.inline;
+    const shardSize = +list.dataset.shardSize;
+    const urls = list.dataset.shards.split(' ');
+    const search = document.querySelector('.pub-search');
+
+    list.querySelectorAll(':scope > .pub-item').forEach((item, i) => { item.dataset.i = i; });
+    // One container per shard keeps the list in order whichever loads first
+    const shards = urls.map(() => list.appendChild(document.createElement('div')));
+    shards.forEach(shard => { shard.className = 'pub-shard'; });
+
+    let matches = null;
+    function applyFilter() {
+        list.querySelectorAll('.pub-item').forEach(item => {
+            item.hidden = matches !== null && !matches.has(+item.dataset.i);
+        });
+    }
+
+    const loading = {};
+    function loadShard(k) {
+        if (!loading[k]) {
+            loading[k] = fetch(urls[k]).then(r => r.json()).then(items => {
+                shards[k].innerHTML = items.join('');
+                Array.from(shards[k].children).forEach((item, j) => {
+                    item.dataset.i = inline + k * shardSize + j;
+                });
+                applyFilter();
+            });
+        }
+        return loading[k];
+    }
+
+    // Infinite scroll: load shards in order while the end of the list is near
+    const sentinel = document.createElement('div');
+    list.after(sentinel);
+    let nearEnd = false;
+    function more() {
+        const next = urls.findIndex((_, k) => !loading[k]);
+        if (nearEnd && next >= 0) loadShard(next).then(more);
+    }
+    new IntersectionObserver(entries => {
+        nearEnd = entries[0].isIntersecting;
+        more();
+    }, { rootMargin: '600px 0px' }).observe(sentinel);
+
+    // Search: every typed word must prefix a word of the title, authors or venue
+    let index = null;
+    const loadIndex = () => index || (index = fetch(list.dataset.index).then(r => r.json()));
+    const words = text => text.toLowerCase().match(/[a-z0-9]+|[^\x00-\x7f\s]/g) || [];
+    let query = 0;
+    search.addEventListener('focus', loadIndex, { once: true });
+    search.addEventListener('input', async () => {
+        const terms = words(search.value);
+        const current = ++query;
+        if (!terms.length) {
+            matches = null;
+            applyFilter();
+            return;
+        }
+        const idx = await loadIndex();
+        if (current !== query) return;
+        let found = null;
+        terms.forEach(term => {
+            const ids = new Set();
+            Object.keys(idx).forEach(word => {
+                if (word.startsWith(term)) idx[word].forEach(i => ids.add(i));
+            });
+            found = found ? new Set([...found].filter(i => ids.has(i))) : ids;
+        });
+        matches = found;
+        applyFilter();
+        new Set([...found].filter(i => i >= inline).map(i => Math.floor((i - inline) / shardSize)))
+            .forEach(loadShard);
+    });
+})();
+
+// @feature defer
+// Deferred sections (build.py --defer-sections): long sections ship their
+// markup in a <template data-deferred>, put in place as the section comes
+// within a screen of the viewport. In-page links and URL hashes materialize
+// them all first, so the jump lands where the real content puts the target.
+(function () {
+    const pending = new Map();
+    document.querySelectorAll('template[data-deferred]').forEach(tpl => {
+        pending.set(tpl.closest('section'), tpl);
+    });
+    if (!pending.size) return;
+
+    const near = new IntersectionObserver(entries => {
+        entries.forEach(entry => {
+            if (entry.isIntersecting) materialize(entry.target);
+        });
+    }, { rootMargin: '100% 0px' });
+
+    function materialize(section) {
+        const tpl = pending.get(section);
+        if (!tpl) return;
+        pending.delete(section);
+        near.unobserve(section);
+        tpl.replaceWith(tpl.content);
+    }
+
+    function materializeAll() {
+        Array.from(pending.keys()).forEach(materialize);
+    }
+
+    function jumpToHash() {
+        if (!pending.size) return;
+        materializeAll();
+        const target = location.hash && document.getElementById(location.hash.slice(1));
+        if (target) target.scrollIntoView();
+    }
+
+    pending.forEach((_, section) => near.observe(section));
+    document.addEventListener('click', e => {
+        if (e.target.closest('a[href^="#"]')) materializeAll();
+    });
+    window.addEventListener('hashchange', jumpToHash);
+    jumpToHash();
+})();
+
+// @feature sw
+// Offline cache (build.py --service-worker sets window.__sw to the worker URL)
+if (window.__sw && 'serviceWorker' in navigator) {
+    window.addEventListener('load', () => {
+        navigator.serviceWorker.register(window.__sw).catch(() => {});
+    });
+}